@@ -1,8 +1,18 @@
+from __future__ import annotations
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+from core.utils import static_vars
 
-anki_connect_host = "http://localhost:8765"
+anki_connect_host = "localhost"
+anki_connect_port = 8765
 anki_connect_version = 6
+# seconds to wait for AnkiConnect before giving up on a request
+default_timeout = 600.0
+# how many actions are sent in a single "multi" request by default
+default_batch_size = 500
 
 # documentation: https://foosoft.net/projects/anki-connect/index.html#note-actions
 
@@ -35,18 +45,36 @@ def get_notes_in_deck(deck_name: str) -> list[int]:
         }
     )['result']
 
+# default number of ids sent per cardsInfo/notesInfo request when paging through a deck
+default_chunk_size = 1000
+
 def get_cards_info(deck_name: str) -> list[dict]:
-    card_ids = get_cards_in_deck(deck_name)
-    card_infos = get_card_info(card_ids)
-    return card_infos
+    return list(iter_cards_info(deck_name))
 
 # returns a list of (card, note)
 def get_cards_and_notes_in_deck(deck_name: str) -> list[(dict, dict)]:
+    return list(iter_cards_and_notes_in_deck(deck_name))
+
+# yields card info for every card in the deck, fetching chunk_size cards per request
+def iter_cards_info(deck_name: str, chunk_size: int = default_chunk_size) -> Iterator[dict]:
+    card_ids = get_cards_in_deck(deck_name)
+    return iter_card_info(card_ids, chunk_size)
+
+def iter_card_info(card_ids: list[int], chunk_size: int = default_chunk_size) -> Iterator[dict]:
+    for start in range(0, len(card_ids), chunk_size):
+        yield from get_card_info(card_ids[start:start + chunk_size])
+
+# yields (card, note) for every card in the deck, fetching chunk_size cards (and their notes) per request
+# only one chunk of responses is held in memory at a time
+def iter_cards_and_notes_in_deck(deck_name: str, chunk_size: int = default_chunk_size) -> Iterator[tuple[dict, dict]]:
     card_ids = get_cards_in_deck(deck_name)
-    card_infos = get_card_info(card_ids)
-    note_ids = [c['note'] for c in card_infos]
-    note_infos = get_note_info(note_ids)
-    return zip(card_infos, note_infos)
+    return iter_cards_and_notes(card_ids, chunk_size)
+
+def iter_cards_and_notes(card_ids: list[int], chunk_size: int = default_chunk_size) -> Iterator[tuple[dict, dict]]:
+    for start in range(0, len(card_ids), chunk_size):
+        card_infos = get_card_info(card_ids[start:start + chunk_size])
+        note_infos = get_note_info([c['note'] for c in card_infos])
+        yield from zip(card_infos, note_infos)
 
 def get_card_info(card_ids: list[int]) -> list[dict]:
     return ankiconnect_action(
@@ -70,15 +98,33 @@ def set_card_values(card_id: int, fields: dict[str, str]) -> None:
         "newValues": values,
         "warning_check": True,
     }
+    def check_result(result: dict) -> None:
+        results = result['result']
+        for r in results:
+            if not r:
+                raise ValueError(f"operation failed\nrequest: {params}\nresult: {result}")
+
+    dispatch_action("setSpecificValueOfCard", params=params, on_result=check_result)
+
+# returns card id -> modification timestamp, which is much cheaper to fetch than cardsInfo
+def get_cards_mod_time(card_ids: list[int]) -> dict[int, int]:
     result = ankiconnect_action(
-        "setSpecificValueOfCard",
-        params=params,
-    )
+        action="cardsModTime",
+        params={
+            "cards": card_ids,
+        }
+    )['result']
+    return {r['cardId']: r['mod'] for r in result}
 
-    results = result['result']
-    for r in results:
-        if not r:
-            raise ValueError(f"operation failed\nrequest: {params}\nresult: {result}")
+# returns note id -> modification timestamp, which is much cheaper to fetch than notesInfo
+def get_notes_mod_time(note_ids: list[int]) -> dict[int, int]:
+    result = ankiconnect_action(
+        action="notesModTime",
+        params={
+            "notes": note_ids,
+        }
+    )['result']
+    return {r['noteId']: r['mod'] for r in result}
 
 # note ids to note info
 def get_note_info(note_ids: list[int]) -> list[dict]:
@@ -90,8 +136,8 @@ def get_note_info(note_ids: list[int]) -> list[dict]:
     )['result']
 
 
-def update_note_field(note_id: int, field_name: str, new_value: str):
-    ankiconnect_action(
+def update_note_field(note_id: int, field_name: str, new_value: str, on_result: Callable[[dict], None] | None = None):
+    dispatch_action(
         action="updateNoteFields",
         params={
             "note": {
@@ -100,11 +146,12 @@ def update_note_field(note_id: int, field_name: str, new_value: str):
                     field_name: new_value,
                 }
             }
-        }
+        },
+        on_result=on_result,
     )
 
 def add_note(note: dict):
-    return ankiconnect_action(
+    return dispatch_action(
         action="addNote",
         params={
             "note": note,
@@ -119,17 +166,144 @@ def create_model(model: dict):
     )
 
 
-def ankiconnect_action(action: str, params: dict | None = None) -> dict:
+# a single action waiting to be sent as part of a "multi" request
+@dataclass
+class QueuedAction:
+    action: str
+    params: dict | None
+    on_result: Callable[[dict], None] | None = None
+
+# collects actions and sends them to AnkiConnect in "multi" requests of at most batch_size actions
+# results are stored in the order the actions were queued, each in the usual {"result": ..., "error": ...} shape
+#
+# usage:
+#   with anki_connect.batch() as b:
+#       for note in notes:
+#           anki_connect.update_note_field(note_id, field_name, value) # queued instead of sent immediately
+#   results = b.results
+@dataclass
+class ActionBatch:
+    batch_size: int = default_batch_size
+    pending: list[QueuedAction] = field(default_factory=list)
+    results: list[dict] = field(default_factory=list)
+
+    # returns the index of the action's result in self.results (valid once the batch has been flushed)
+    def queue(self, action: str, params: dict | None = None, on_result: Callable[[dict], None] | None = None) -> int:
+        self.pending.append(QueuedAction(action, params, on_result))
+        index = len(self.results) + len(self.pending) - 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return index
+
+    def flush(self) -> None:
+        if len(self.pending) == 0:
+            return
+        queued = self.pending
+        self.pending = []
+        results = multi_action([(q.action, q.params) for q in queued], batch_size=self.batch_size)
+        self.results.extend(results)
+        for q, result in zip(queued, results):
+            if q.on_result is not None:
+                q.on_result(result)
+
+    def __enter__(self) -> ActionBatch:
+        active_batches.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        active_batches.remove(self)
+        # don't send the remaining actions if the loop that queued them failed
+        if exc_type is None:
+            self.flush()
+
+# stack of batches opened via `with batch():`, the innermost one receives dispatched actions
+active_batches: list[ActionBatch] = []
+
+def batch(batch_size: int = default_batch_size) -> ActionBatch:
+    return ActionBatch(batch_size=batch_size)
+
+# sends the action immediately, or queues it if called inside a `with batch():` block
+# when queued, the return value is None and on_result (if given) is called once the batch is flushed
+def dispatch_action(action: str, params: dict | None = None, on_result: Callable[[dict], None] | None = None) -> dict | None:
+    if len(active_batches) > 0:
+        active_batches[-1].queue(action, params, on_result)
+        return None
+    result = ankiconnect_action(action, params)
+    if on_result is not None:
+        on_result(result)
+    return result
+
+# sends many actions using AnkiConnect's "multi" action, splitting them into requests of at most batch_size actions
+# returns one {"result": ..., "error": ...} dict per action, in the same order as the given actions
+def multi_action(actions: list[tuple[str, dict | None]], batch_size: int = default_batch_size) -> list[dict]:
+    results: list[dict] = []
+    for start in range(0, len(actions), batch_size):
+        chunk = actions[start:start + batch_size]
+        response = ankiconnect_action(
+            action="multi",
+            params={
+                "actions": [action_body(action, params) for action, params in chunk],
+            }
+        )
+        if response.get('error') is not None:
+            raise RuntimeError(f"multi request failed: {response['error']}")
+        results.extend(response['result'])
+    return results
+
+def action_body(action: str, params: dict | None = None) -> dict[str, Any]:
     if params is None:
-        data = {
+        return {
             "action": action,
             "version": anki_connect_version,
         }
     else:
-        data = {
+        return {
             "action": action,
             "version": anki_connect_version,
             "params": params,
         }
-    response = requests.post(url=anki_connect_host, json=data)
-    return json.loads(response.text)
\ No newline at end of file
+
+# holds a persistent HTTP session so that consecutive actions reuse the same keep-alive connection instead of reconnecting each time
+class AnkiConnectClient:
+    def __init__(self, host: str = anki_connect_host, port: int = anki_connect_port, timeout: float | None = default_timeout, pool_size: int = 4):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+
+    def action(self, action: str, params: dict | None = None) -> dict:
+        data = json.dumps(action_body(action, params), ensure_ascii=False).encode("utf8")
+        response = self.session.post(
+            url=self.url,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        # decode the raw bytes directly rather than going through response.text
+        return json.loads(response.content)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> AnkiConnectClient:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+@static_vars(client=None)
+def default_client() -> AnkiConnectClient:
+    if default_client.client is None:
+        default_client.client = AnkiConnectClient()
+    return default_client.client
+
+# replaces the client used by all functions in this module (e.g., to point at a different host/port)
+def set_default_client(client: AnkiConnectClient) -> None:
+    if default_client.client is not None and default_client.client is not client:
+        default_client.client.close()
+    default_client.client = client
+
+def ankiconnect_action(action: str, params: dict | None = None) -> dict:
+    return default_client().action(action, params)
\ No newline at end of file
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import asyncio
+from core.anki_connect import AnkiConnectClient, anki_connect_host, anki_connect_port, default_timeout
+
+# asyncio counterpart to core.anki_connect
+# each request runs on a worker thread using a pooled AnkiConnectClient, and a semaphore bounds how many requests are in flight at once
+# (AnkiConnect itself handles requests one at a time inside Anki, so the gain comes from overlapping network/serialization time, not from parallel execution in Anki)
+class AsyncAnkiConnect:
+    def __init__(self, host: str = anki_connect_host, port: int = anki_connect_port, timeout: float | None = default_timeout, max_in_flight: int = 4):
+        self.client = AnkiConnectClient(host=host, port=port, timeout=timeout, pool_size=max_in_flight)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def action(self, action: str, params: dict | None = None) -> dict:
+        async with self.semaphore:
+            return await asyncio.to_thread(self.client.action, action, params)
+
+    # same as action(), but raises if AnkiConnect reports an error and returns only the result
+    async def result(self, action: str, params: dict | None = None) -> any:
+        response = await self.action(action, params)
+        if response.get('error') is not None:
+            raise RuntimeError(f"AnkiConnect action {action} failed: {response['error']}")
+        return response['result']
+
+    async def find_cards(self, query: str) -> list[int]:
+        return await self.result("findCards", {"query": query})
+
+    async def cards_info(self, card_ids: list[int]) -> list[dict]:
+        return await self.result("cardsInfo", {"cards": card_ids})
+
+    async def notes_info(self, note_ids: list[int]) -> list[dict]:
+        return await self.result("notesInfo", {"notes": note_ids})
+
+    async def update_note_field(self, note_id: int, field_name: str, new_value: str) -> None:
+        await self.result("updateNoteFields", {
+            "note": {
+                "id": note_id,
+                "fields": {
+                    field_name: new_value,
+                }
+            }
+        })
+
+    async def set_card_values(self, card_id: int, fields: dict[str, str]) -> None:
+        params = {
+            "card": card_id,
+            "keys": list(fields.keys()),
+            "newValues": list(fields.values()),
+            "warning_check": True,
+        }
+        results = await self.result("setSpecificValueOfCard", params)
+        for r in results:
+            if not r:
+                raise ValueError(f"operation failed\nrequest: {params}\nresult: {results}")
+
+    async def add_note(self, note: dict) -> int:
+        return await self.result("addNote", {"note": note})
+
+    async def close(self) -> None:
+        self.client.close()
+
+    async def __aenter__(self) -> AsyncAnkiConnect:
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+# fetches cardsInfo and notesInfo for chunks of card ids concurrently
+# returns a list of (card, note), in the same order as the cards returned by findCards
+async def get_cards_and_notes_in_deck_async(deck_name: str, chunk_size: int = 1000, client: AsyncAnkiConnect | None = None) -> list[tuple[dict, dict]]:
+    if client is None:
+        async with AsyncAnkiConnect() as new_client:
+            return await get_cards_and_notes_in_deck_async(deck_name, chunk_size, new_client)
+
+    card_ids = await client.find_cards(f"deck:\"{deck_name}\"")
+    chunks = [card_ids[i:i + chunk_size] for i in range(0, len(card_ids), chunk_size)]
+
+    async def fetch_chunk(chunk: list[int]) -> list[tuple[dict, dict]]:
+        card_infos = await client.cards_info(chunk)
+        note_infos = await client.notes_info([c['note'] for c in card_infos])
+        return list(zip(card_infos, note_infos))
+
+    results = await asyncio.gather(*[fetch_chunk(chunk) for chunk in chunks])
+    return [pair for chunk_result in results for pair in chunk_result]
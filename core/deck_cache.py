@@ -0,0 +1,100 @@
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+import core.anki_connect as anki_connect
+from core.utils import print_utf8, atomic_write
+
+default_deck_cache_dir = Path('./cache/decks')
+
+# on-disk snapshot of a deck's cardsInfo/notesInfo results
+# cards are keyed by card id and notes by note id, each stored along with Anki's "mod" timestamp at the time it was fetched
+# reviews update a card's mod, and edits update a note's mod, so comparing against a fresh mod query tells us exactly what to re-fetch
+# cardsInfo records also contain note data (fields, question, answer), so a card is re-fetched when either its own mod or its note's mod changed
+@dataclass
+class DeckSnapshot:
+    cards: dict[int, dict] = field(default_factory=dict)
+    card_mods: dict[int, int] = field(default_factory=dict)
+    notes: dict[int, dict] = field(default_factory=dict)
+    note_mods: dict[int, int] = field(default_factory=dict)
+
+def deck_cache_path(deck_name: str, cache_dir: Path = default_deck_cache_dir) -> Path:
+    # deck names can contain characters that aren't valid in filenames (e.g., "::" or "*")
+    filename = re.sub(r'[^\w\-]+', '_', deck_name).strip('_')
+    return cache_dir / f"{filename}.json"
+
+def load_snapshot(path: Path) -> DeckSnapshot:
+    if not path.is_file():
+        return DeckSnapshot()
+    with open(path, 'rb') as f:
+        raw = f.read()
+    # a damaged snapshot is treated as empty, so the whole deck is fetched again (and the snapshot rewritten) instead of failing on every run
+    # (JSONDecodeError and UnicodeDecodeError are both ValueErrors, and a snapshot with the wrong shape raises one of the others)
+    try:
+        data = json.loads(raw)
+        # JSON object keys are always strings, so convert the ids back to ints
+        return DeckSnapshot(
+            cards={int(k): v for k, v in data['cards'].items()},
+            card_mods={int(k): v for k, v in data['card_mods'].items()},
+            notes={int(k): v for k, v in data['notes'].items()},
+            note_mods={int(k): v for k, v in data['note_mods'].items()},
+        )
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        print_utf8(f"deck snapshot {path} is damaged ({e}), the deck will be fetched again")
+        return DeckSnapshot()
+
+def save_snapshot(snapshot: DeckSnapshot, path: Path) -> None:
+    data = {
+        'cards': snapshot.cards,
+        'card_mods': snapshot.card_mods,
+        'notes': snapshot.notes,
+        'note_mods': snapshot.note_mods,
+    }
+    with atomic_write(path) as f:
+        f.write(json.dumps(data, ensure_ascii=False).encode('utf8'))
+
+# read-through cache for anki_connect.get_cards_and_notes_in_deck
+# only cards/notes whose mod timestamp changed since the last run (or that are new) are fetched from Anki
+# returns a list of (card, note) in the order returned by findCards
+def cached_cards_and_notes_in_deck(deck_name: str, cache_dir: Path = default_deck_cache_dir, chunk_size: int = anki_connect.default_chunk_size) -> list[tuple[dict, dict]]:
+    path = deck_cache_path(deck_name, cache_dir)
+    snapshot = load_snapshot(path)
+
+    card_ids = anki_connect.get_cards_in_deck(deck_name)
+    card_mods = anki_connect.get_cards_mod_time(card_ids)
+    stale_card_ids = [c for c in card_ids if c not in snapshot.cards or snapshot.card_mods.get(c) != card_mods.get(c)]
+
+    # refresh changed cards, and drop cards that are no longer in the deck
+    cards: dict[int, dict] = {c: snapshot.cards[c] for c in card_ids if c in snapshot.cards}
+    for card in anki_connect.iter_card_info(stale_card_ids, chunk_size):
+        cards[card['cardId']] = card
+
+    note_ids = list(dict.fromkeys(card['note'] for card in cards.values()))
+    note_mods = anki_connect.get_notes_mod_time(note_ids)
+    stale_note_ids = [n for n in note_ids if n not in snapshot.notes or snapshot.note_mods.get(n) != note_mods.get(n)]
+
+    notes: dict[int, dict] = {n: snapshot.notes[n] for n in note_ids if n in snapshot.notes}
+    for start in range(0, len(stale_note_ids), chunk_size):
+        for note in anki_connect.get_note_info(stale_note_ids[start:start + chunk_size]):
+            notes[note['noteId']] = note
+
+    # editing a note doesn't change its cards' mod, but it does change the note fields stored in their cardsInfo records
+    stale_note_set = set(stale_note_ids)
+    stale_card_set = set(stale_card_ids)
+    edited_card_ids = [c for c in card_ids if c not in stale_card_set and cards[c]['note'] in stale_note_set]
+    for card in anki_connect.iter_card_info(edited_card_ids, chunk_size):
+        cards[card['cardId']] = card
+    stale_card_ids += edited_card_ids
+
+    print_utf8(f"deck {deck_name}: fetched {len(stale_card_ids)}/{len(card_ids)} cards and {len(stale_note_ids)}/{len(note_ids)} notes, the rest were read from {path}")
+
+    if len(stale_card_ids) > 0 or len(stale_note_ids) > 0 or len(cards) != len(snapshot.cards) or len(notes) != len(snapshot.notes):
+        save_snapshot(DeckSnapshot(
+            cards=cards,
+            card_mods={c: card_mods.get(c) for c in cards},
+            notes=notes,
+            note_mods={n: note_mods.get(n) for n in notes},
+        ), path)
+
+    return [(cards[c], notes[cards[c]['note']]) for c in card_ids]
@@ -1,9 +1,11 @@
 from __future__ import annotations
 from core.dictionaries.stardict import Stardict
-from core.dictionaries.yomichan import YomichanDictionary
+from core.dictionaries.yomichan import YomichanDictionary, YomichanDictionaryEntry
 from dataclasses import dataclass
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from enum import Enum
+from typing import Callable, Iterable, Iterator
+import zipfile
 
 class DictionaryType(Enum):
     UNKNOWN = 0
@@ -19,7 +21,7 @@ class BasicDictionaryEntry:
 @dataclass(frozen=True)
 class BasicDictionary:
     name: str
-    entries: list[BasicDictionaryEntry]
+    entries: Iterable[BasicDictionaryEntry]
 
     @staticmethod
     def from_dir(path: Path) -> BasicDictionary:
@@ -34,6 +36,8 @@ def load_dictionary_from_path(path: Path) -> BasicDictionary:
     d: YomichanDictionary | Stardict | None = None
     if dictionary_type == DictionaryType.STARDICT:
         d = Stardict.from_dir(path)
+    elif dictionary_type == DictionaryType.YOMICHAN and path.suffix == '.zip':
+        d = YomichanDictionary.from_zip(path)
     elif dictionary_type == DictionaryType.YOMICHAN:
         d = YomichanDictionary.from_dir(path)
     else:
@@ -63,30 +67,47 @@ def load_dictionary_from_stardict(d: Stardict) -> BasicDictionary:
         entries=entries,
     )
 
+# Yomichan entries are streamed from disk, so they're converted as they're iterated over rather than collected into a list
 def load_dictionary_from_yomichan(d: YomichanDictionary) -> BasicDictionary:
-    entries: list[BasicDictionaryEntry] = []
-    for entry in d.entries:
-        entries.append(BasicDictionaryEntry(
-            term=entry.term,
-            reading=entry.reading,
-            definition='\n\n'.join(entry.definitions),
-        ))
-
     return BasicDictionary(
         name=d.name,
-        entries=entries,
+        entries=MappedEntries(d.entries, basic_entry_from_yomichan),
     )
 
+def basic_entry_from_yomichan(entry: YomichanDictionaryEntry) -> BasicDictionaryEntry:
+    return BasicDictionaryEntry(
+        term=entry.term,
+        reading=entry.reading,
+        definition='\n\n'.join(entry.definitions),
+    )
+
+# like map(), but can be iterated over any number of times (as long as the underlying entries can)
+class MappedEntries:
+    def __init__(self, entries: Iterable, convert: Callable):
+        self.entries = entries
+        self.convert = convert
+
+    def __iter__(self) -> Iterator:
+        for entry in self.entries:
+            yield self.convert(entry)
+
 def detect_dictionary_type(path: Path) -> DictionaryType:
     yomichan_extensions = set(['.json'])
     stardict_extensions = set(['.dict', '.dict.dz', '.ifo', '.idx'])
 
+    # dictionaries can also be left in the zip file they were distributed in, in which case the files inside the archive are checked instead
+    if path.is_file() and path.suffix == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            suffixes = [PurePosixPath(name).suffix for name in archive.namelist()]
+    else:
+        suffixes = [entry.suffix for entry in path.iterdir()]
+
     yomichan_count = 0
     stardict_count = 0
-    for entry in path.iterdir():
-        if entry.suffix in yomichan_extensions:
+    for suffix in suffixes:
+        if suffix in yomichan_extensions:
             yomichan_count += 1
-        elif entry.suffix in stardict_extensions:
+        elif suffix in stardict_extensions:
             stardict_count += 1
 
     if yomichan_count > stardict_count:
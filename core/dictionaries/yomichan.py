@@ -1,10 +1,13 @@
 from __future__ import annotations
+import io
 import json
-from pathlib import Path
+import zipfile
+from pathlib import Path, PurePosixPath
 from dataclasses import dataclass
 import os
 import re
-from core.utils import print_utf8
+from typing import IO, Iterable, Iterator
+from core.utils import print_utf8, iter_json_array
 
 # fields with "fieldX" names are fields for which I have no idea what it's supposed to contain
 @dataclass(frozen=True)
@@ -18,22 +21,44 @@ class YomichanDictionaryEntry:
     entry_order: int
     field8: str
 
+# the entries of a dictionary's term banks, read from disk each time they're iterated over
+# entries are streamed one at a time (see iter_term_bank), so a dictionary never has to fit in memory, no matter how many term banks it has
+# if archive is given, term_banks are the names of members of that zip file, which are decompressed as they're read rather than extracted
+class YomichanTermBanks:
+    def __init__(self, term_banks: list[Path] | list[str], archive: Path | None = None):
+        self.term_banks = term_banks
+        self.archive = archive
+
+    def __iter__(self) -> Iterator[YomichanDictionaryEntry]:
+        if self.archive is None:
+            for term_bank in self.term_banks:
+                with open(term_bank, 'r', encoding='utf8') as term_bank_file:
+                    yield from iter_term_bank(term_bank_file)
+        else:
+            with zipfile.ZipFile(self.archive) as archive:
+                for term_bank in self.term_banks:
+                    with io.TextIOWrapper(archive.open(term_bank), encoding='utf8') as term_bank_file:
+                        yield from iter_term_bank(term_bank_file)
+
 @dataclass(frozen=True)
 class YomichanDictionary:
     name: str
     revision: str
-    entries: list[YomichanDictionaryEntry]
+    entries: Iterable[YomichanDictionaryEntry]
 
     @staticmethod
     def from_dir(path: Path) -> YomichanDictionary:
         return load_dictionary(path)
 
+    @staticmethod
+    def from_zip(path: Path) -> YomichanDictionary:
+        return load_dictionary_from_zip(path)
+
 # Path must point to the directory containing the dictionary's JSON files
+# only index.json is read here, the term banks are read lazily whenever the dictionary's entries are iterated over
 def load_dictionary(path: Path) -> YomichanDictionary:
     print_utf8(f"loading Yomichan dict from {path}")
 
-    term_bank_re = re.compile(r"term_bank_[0-9]+")
-
     term_banks: list[Path] = []
     index: Path | None = None
 
@@ -51,38 +76,66 @@ def load_dictionary(path: Path) -> YomichanDictionary:
     # extract data from the index
     with open(index, 'r', encoding='utf8') as index_file:
         index_data = json.load(index_file)
-        name = index_data['title']
-        revision = index_data['revision']
-
-        # parse all terms from the term bank
-        terms: list[YomichanDictionaryEntry] = []
-
-        for term_bank in term_banks:
-            with open(term_bank, 'r', encoding='utf8') as term_bank_file:
-                bank_data = json.load(term_bank_file)
-                # the term bank is an array of terms
-                for term_data in bank_data:
-                    # clean definitions
-                    raw_definitions = term_data[5]
-                    definitions = [clean_definition(d) for d in raw_definitions]
-
-                    # each term is an array of fields (0-7, 8 total fields)
-                    term = YomichanDictionaryEntry(
-                        term=term_data[0],
-                        reading=term_data[1],
-                        field3=term_data[2],
-                        field4=term_data[3],
-                        field5=term_data[4],
-                        definitions=definitions,
-                        entry_order=term_data[6],
-                        field8=term_data[7]
-                    )
-                    terms.append(term)
-
-        return YomichanDictionary(
-            name=name,
-            revision=revision,
-            entries=terms,
+
+    return YomichanDictionary(
+        name=index_data['title'],
+        revision=index_data['revision'],
+        entries=YomichanTermBanks(sorted(term_banks, key=lambda p: term_bank_number(p.stem))),
+    )
+
+# Path must point to the dictionary's zip file, as distributed (no need to extract it)
+# like load_dictionary, only index.json is read here
+def load_dictionary_from_zip(path: Path) -> YomichanDictionary:
+    print_utf8(f"loading Yomichan dict from {path}")
+
+    term_banks: list[str] = []
+    index: str | None = None
+
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            # some archives keep the files in a subdirectory, so only the file name is checked
+            member_path = PurePosixPath(member.filename)
+            if member.is_dir() or member_path.suffix != '.json':
+                continue
+            if member_path.stem == "index":
+                index = member.filename
+            elif term_bank_re.match(member_path.stem):
+                term_banks.append(member.filename)
+
+        if index is None:
+            raise ValueError(f"Yomichan dictionary {path} has no index.json")
+        with archive.open(index) as index_file:
+            index_data = json.load(index_file)
+
+    return YomichanDictionary(
+        name=index_data['title'],
+        revision=index_data['revision'],
+        entries=YomichanTermBanks(sorted(term_banks, key=lambda name: term_bank_number(PurePosixPath(name).stem)), archive=path),
+    )
+
+term_bank_re = re.compile(r"term_bank_([0-9]+)")
+
+# term banks are numbered from 1, sort them numerically so that entries come out in the dictionary's order (term_bank_10 after term_bank_9)
+def term_bank_number(filestem: str) -> int:
+    return int(term_bank_re.match(filestem).group(1))
+
+# the term bank is an array of terms, each of which is parsed as soon as it has been read
+def iter_term_bank(term_bank_file: IO[str]) -> Iterator[YomichanDictionaryEntry]:
+    for term_data in iter_json_array(term_bank_file):
+        # clean definitions
+        raw_definitions = term_data[5]
+        definitions = [clean_definition(d) for d in raw_definitions]
+
+        # each term is an array of fields (0-7, 8 total fields)
+        yield YomichanDictionaryEntry(
+            term=term_data[0],
+            reading=term_data[1],
+            field3=term_data[2],
+            field4=term_data[3],
+            field5=term_data[4],
+            definitions=definitions,
+            entry_order=term_data[6],
+            field8=term_data[7]
         )
 
 def clean_definition(definition: str | dict) -> str:
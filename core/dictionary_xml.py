@@ -0,0 +1,114 @@
+from __future__ import annotations
+import gzip
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import IO, Iterator
+from tqdm import tqdm
+from core.kanji import Kanji, Radical, Variant
+from core.vocab import CompactVocab, StringTable, KanjiVocabIndex, build_kanji_vocab_index, jmdict_frequency_rank
+from core.radicals import ComponentIndex, load_component_index, default_kradfile_paths, radical_character, variant_character
+from core.utils import CacheSpec, cached_load_spec, memoized
+
+# imports JMdict and KANJIDIC2 straight from their XML releases (e.g., JMdict_e.gz and kanjidic2.xml.gz from https://www.edrdg.org/)
+# this skips jamdict's SQLite database entirely: the files are parsed incrementally, and each <entry>/<character> element is
+# converted to the project's own records and then cleared, so memory use while parsing doesn't grow with the size of the file
+
+default_jmdict_path = Path('./data/JMdict_e.gz')
+default_kanjidic2_path = Path('./data/kanjidic2.xml.gz')
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+def open_xml(path: Path) -> IO[bytes]:
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rb')
+    else:
+        return open(path, 'rb')
+
+# yields each element with the given tag once it has been completely parsed
+# the caller must be done with the element before asking for the next one, because it is cleared (along with everything parsed before it)
+def iter_elements(path: Path, tag: str) -> Iterator[ET.Element]:
+    with open_xml(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, element in context:
+            if event == 'end' and element.tag == tag:
+                yield element
+                # drop the element and detach it from the root, otherwise the root keeps every parsed element alive
+                element.clear()
+                root.clear()
+
+def iter_jmdict_xml(path: Path = default_jmdict_path, strings: StringTable | None = None) -> Iterator[CompactVocab]:
+    if strings is None:
+        strings = StringTable()
+    for entry in iter_elements(path, 'entry'):
+        glosses: list[int] = []
+        for gloss in entry.iterfind('sense/gloss'):
+            # English glosses have no xml:lang attribute (or "eng" explicitly)
+            if gloss.get(XML_LANG, 'eng') == 'eng' and gloss.text is not None:
+                glosses.append(strings.intern(gloss.text))
+        yield CompactVocab(
+            idseq=int(entry.findtext('ent_seq')),
+            kanji_form_ids=tuple(strings.intern(keb.text) for keb in entry.iterfind('k_ele/keb')),
+            kana_form_ids=tuple(strings.intern(reb.text) for reb in entry.iterfind('r_ele/reb')),
+            gloss_ids=tuple(glosses),
+            frequency_rank=jmdict_frequency_rank([p.text for p in entry.iterfind('k_ele/ke_pri')] + [p.text for p in entry.iterfind('r_ele/re_pri')]),
+            strings=strings,
+        )
+
+def iter_kanjidic2_xml(kanji_to_vocab_mapping: KanjiVocabIndex, path: Path = default_kanjidic2_path, component_index: ComponentIndex | None = None) -> Iterator[Kanji]:
+    if component_index is None:
+        component_index = load_component_index()
+    for character in iter_elements(path, 'character'):
+        literal = character.findtext('literal')
+        misc = character.find('misc')
+
+        # see core.kanji.load_all_kanji_internal for why reading/meaning groups are flattened
+        meanings: list[str] = []
+        on_yomi: list[str] = []
+        kun_yomi: list[str] = []
+        for group in character.iterfind('reading_meaning/rmgroup'):
+            for meaning in group.iterfind('meaning'):
+                # English meanings have no m_lang attribute
+                if meaning.get('m_lang') is None:
+                    meanings.append(meaning.text)
+            for reading in group.iterfind('reading'):
+                if reading.get('r_type') == 'ja_on':
+                    on_yomi.append(reading.text)
+                if reading.get('r_type') == 'ja_kun':
+                    kun_yomi.append(reading.text)
+
+        yield Kanji(
+            character=literal,
+            radicals=[Radical(r.text, r.get('rad_type'), radical_character(r.text, r.get('rad_type'))) for r in character.iterfind('radical/rad_value')],
+            variants=[Variant(v.text, v.get('var_type'), variant_character(v.text, v.get('var_type'))) for v in misc.iterfind('variant')],
+            # the first stroke count is the accepted one, any others are common miscounts
+            stroke_count=int(misc.findtext('stroke_count')),
+            grade=misc.findtext('grade'),
+            jlpt_level=misc.findtext('jlpt'),
+            frequency=misc.findtext('freq'),
+            meanings=meanings,
+            on_yomi=on_yomi,
+            kun_yomi=kun_yomi,
+            nanori=[n.text for n in character.iterfind('reading_meaning/nanori')],
+            example_words=kanji_to_vocab_mapping.get(literal, []),
+            components=component_index.components_of(literal),
+        )
+
+def import_kanji_from_xml(jmdict_path: Path = default_jmdict_path, kanjidic2_path: Path = default_kanjidic2_path) -> list[Kanji]:
+    print(f"importing vocab from {jmdict_path}...")
+    mapping = build_kanji_vocab_index(iter_jmdict_xml(jmdict_path))
+    print(f"importing kanji from {kanjidic2_path}...")
+    return list(tqdm(iter_kanjidic2_xml(mapping, kanjidic2_path)))
+
+def kanji_xml_cache_spec(jmdict_path: Path = default_jmdict_path, kanjidic2_path: Path = default_kanjidic2_path) -> CacheSpec:
+    return CacheSpec(
+        path=Path('./cache/kanji_xml.bson'),
+        schema_version=1,
+        sources=(jmdict_path, kanjidic2_path) + default_kradfile_paths,
+        code=(import_kanji_from_xml, iter_jmdict_xml, iter_kanjidic2_xml, build_kanji_vocab_index, jmdict_frequency_rank, radical_character, variant_character),
+    )
+
+# equivalent to core.kanji.load_all_kanji_cached, but built from the XML releases rather than the jamdict database
+@memoized
+def load_all_kanji_from_xml_cached(jmdict_path: Path = default_jmdict_path, kanjidic2_path: Path = default_kanjidic2_path) -> list[Kanji]:
+    return cached_load_spec(lambda: import_kanji_from_xml(jmdict_path, kanjidic2_path), list[Kanji], kanji_xml_cache_spec(jmdict_path, kanjidic2_path))
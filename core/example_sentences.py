@@ -1,80 +1,459 @@
+from __future__ import annotations
 from core.utils import *
 
-from enum import Enum
 from dataclasses import dataclass
 from tqdm import tqdm
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, Sequence, TextIO
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from core.dictionaries.frequency import FrequencySource
+import gzip
+import hashlib
+import heapq
+import csv
+import math
+import lzma
+import mmap
+import os
+import struct
 
 @dataclass(frozen=True)
 class ParallelSentence:
     japanese: str
     english: str
 
-class CharType(Enum):
-    OTHER = 0
-    KANJI = 1
-    HIRAGANA = 2
-    KATAKANA = 3
-
-def sentence_map() -> dict[str, list[ParallelSentence]]:
-    sentences = read_sentences()
-    return create_sentence_map(sentences)
-
-def read_sentences() -> list[ParallelSentence]:
-    sentences = []
-    with open('./data/sentence_corpus_tatoeba_org.txt', encoding='utf8') as f:
-        print_utf8("reading sentences from file...")
-        for line in tqdm(f.readlines()):
-            split = line.split("\t")
-            sentence = ParallelSentence(japanese=split[1], english=split[0])
-            sentences.append(sentence)
-    return sentences
-
-
-def create_sentence_map(sentences: list[ParallelSentence]) -> dict[str, list[ParallelSentence]]:
-    result: dict[str, list[ParallelSentence]] = {}
-    print_utf8("creating index of n-grams in sentences...")
-    for sentence in tqdm(sentences):
-        sentence: ParallelSentence
-        keys = sentence_keys(sentence.japanese)
-        for key in keys:
-            if key not in result:
-                result[key] = []
-            result[key].append(sentence)
-
-    return result
-
-def sentence_keys(sentence: str) -> list[str]:
-    MAX_NGRAMS = 15
-    keys = []
-    for i in range(1, MAX_NGRAMS+1):
-        igrams = sentence_to_n_grams(sentence, i)
-        keys.extend(igrams)
-    return keys
-
-def classify_character(c: str) -> CharType:
-    if is_hiragana(c):
-        return CharType.HIRAGANA
-    elif is_katakana(c):
-        return CharType.KATAKANA
-    elif is_probably_kanji(c):
-        return CharType.KANJI
+default_corpus_path = Path('./data/sentence_corpus_tatoeba_org.txt')
+default_index_path = Path('./cache/sentence_index.bin')
+default_frequency_path = Path('./data/japanese_lemma_frequency.csv')
+
+# loads the sentence index from disk, building (and saving) it first if the corpus or word ranks have changed since it was last built
+# sentences are scored with the ranks from frequency_source if one is given (see ranks_from_frequency_source()), otherwise with the lemma CSV at frequency_path
+@memoized
+def sentence_map(corpus_path: Path = default_corpus_path, index_path: Path = default_index_path, workers: int | None = 1, frequency_path: Path = default_frequency_path, frequency_source: FrequencySource | None = None) -> SentenceIndex:
+    if frequency_source is not None:
+        ranks = ranks_from_frequency_source(frequency_source)
     else:
-        return CharType.OTHER
+        ranks = load_lemma_ranks(frequency_path)
+    ranks_hash = ranks_sha256(ranks)
+
+    index = load_sentence_index(index_path, corpus_path, ranks_hash)
+    if index is not None:
+        return index
+
+    # only one process builds the index at a time, the others wait and then load what it wrote
+    with file_lock(lock_path_for(index_path)):
+        index = load_sentence_index(index_path, corpus_path, ranks_hash)
+        if index is None:
+            # sentences are streamed straight into the index builder rather than being read into a list first
+            index = create_sentence_index(iter_sentences(corpus_path), workers=workers, ranks=ranks)
+            save_sentence_index(index, index_path, corpus_path, ranks_hash)
+    return index
+
+def read_sentences(path: Path = default_corpus_path) -> list[ParallelSentence]:
+    return list(iter_sentences(path))
+
+# yields one sentence per line of the corpus ("english<TAB>japanese[<TAB>...]")
+# .gz and .xz corpora are decompressed on the fly, and lines that can't be parsed are skipped rather than aborting the whole read
+def iter_sentences(path: Path = default_corpus_path) -> Iterator[ParallelSentence]:
+    print_utf8(f"reading sentences from {path}...")
+    skipped = 0
+    with open_text(path) as f:
+        for line in tqdm(f):
+            split = line.rstrip("\r\n").split("\t")
+            if len(split) < 2 or split[1].strip() == "":
+                skipped += 1
+                continue
+            yield ParallelSentence(japanese=split[1], english=split[0])
+    if skipped > 0:
+        print_utf8(f"skipped {skipped} malformed lines in {path}")
+
+def open_text(path: Path) -> TextIO:
+    # undecodable bytes are replaced rather than raising, so one bad line doesn't stop the read
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf8', errors='replace')
+    elif path.suffix == '.xz':
+        return lzma.open(path, 'rt', encoding='utf8', errors='replace')
+    else:
+        return open(path, 'r', encoding='utf8', errors='replace')
+
+# marks the end of each sentence in SentenceIndex.japanese, so that matches never span two sentences
+SENTENCE_END = 0
+
+# substring index over a sentence corpus, answering "which sentences contain this text" for a query of any length
+#
+# all Japanese sentences are stored UTF-8 encoded in one buffer, each terminated by SENTENCE_END
+# the suffix array holds the byte offset of every character in that buffer, sorted by the text that follows it (up to the end of its sentence)
+# because UTF-8 preserves code point order under bytewise comparison, every sentence containing a query is found with two binary searches over the suffix array
+# the index takes 4 bytes per character on top of the UTF-8 text itself, instead of one dict entry per n-gram
+class SentenceIndex:
+    def __init__(self, japanese: bytes, japanese_starts: Sequence[int], english: bytes, english_starts: Sequence[int], suffixes: Sequence[int], scores: Sequence[float], mapped: mmap.mmap | None = None):
+        self.japanese = japanese
+        # sentence i is japanese[japanese_starts[i]:japanese_starts[i+1]-1] (the last entry is the length of the buffer)
+        self.japanese_starts = japanese_starts
+        self.english = english
+        self.english_starts = english_starts
+        self.suffixes = suffixes
+        # precomputed quality score of each sentence (lower is better), see score_sentence()
+        self.scores = scores
+        # the memory-mapped file backing the buffers, if the index was loaded from disk
+        self.mapped = mapped
+
+    def __len__(self) -> int:
+        return len(self.japanese_starts) - 1
+
+    # the buffers may be bytes or memoryviews over a memory-mapped index file, so slices are converted explicitly
+    def sentence(self, sentence_id: int) -> ParallelSentence:
+        return ParallelSentence(
+            japanese=str(self.japanese[self.japanese_starts[sentence_id]:self.japanese_starts[sentence_id + 1] - 1], 'utf8'),
+            english=str(self.english[self.english_starts[sentence_id]:self.english_starts[sentence_id + 1]], 'utf8'),
+        )
+
+    # returns the ids of all sentences containing the text, in corpus order
+    def find(self, text: str) -> list[int]:
+        return sorted(self.matching_ids(text))
+
+    # returns the ids of all sentences containing the text, in no particular order
+    def matching_ids(self, text: str) -> set[int]:
+        query = text.encode('utf8')
+        length = len(query)
+        if length == 0:
+            return set()
+        prefix = lambda offset: bytes(self.japanese[offset:offset + length])
+        lo = bisect_left(self.suffixes, query, key=prefix)
+        hi = bisect_right(self.suffixes, query, lo=lo, key=prefix)
+        # a sentence can contain the text more than once
+        return set(bisect_right(self.japanese_starts, self.suffixes[i]) - 1 for i in range(lo, hi))
+
+    # returns up to k sentences containing the text, best scoring first (ties go to the earlier sentence)
+    # the matches are never sorted, only a heap of size k is kept while scanning them, so this costs O(log n + m log k) for m matching sentences
+    def top_sentences(self, text: str, k: int) -> list[ParallelSentence]:
+        ids = heapq.nsmallest(k, self.matching_ids(text), key=lambda i: (self.scores[i], i))
+        return [self.sentence(i) for i in ids]
+
+    # mirrors dict.get so that the index can be used in place of the old n-gram map
+    def get(self, text: str, default: list[ParallelSentence] | None = None) -> list[ParallelSentence]:
+        ids = self.find(text)
+        if len(ids) == 0:
+            return default
+        return [self.sentence(i) for i in ids]
+
+# workers > 1 builds the index in separate processes (None uses one worker per CPU), see create_sentence_index_parallel()
+# ranks maps words to their frequency rank, and is used to score each sentence (see score_sentence())
+def create_sentence_index(sentences: Iterable[ParallelSentence], workers: int | None = 1, ranks: dict[str, int] | None = None) -> SentenceIndex:
+    print_utf8("creating substring index of sentences...")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1:
+        return create_sentence_index_parallel(list(tqdm(sentences)), workers, ranks or {})
+
+    japanese, japanese_starts, english, english_starts, scores = encode_sentences(tqdm(sentences), ranks or {})
+    japanese = bytes(japanese)
+    suffixes = sort_suffixes(japanese)
+    return SentenceIndex(japanese, japanese_starts, bytes(english), english_starts, suffixes, scores)
+
+# appends each sentence to the index buffers, returning (japanese, japanese_starts, english, english_starts, scores)
+def encode_sentences(sentences: Iterable[ParallelSentence], ranks: dict[str, int]) -> tuple[bytearray, array, bytearray, array, array]:
+    japanese = bytearray()
+    japanese_starts = array('I', [0])
+    english = bytearray()
+    english_starts = array('I', [0])
+    scores = array('f')
+    for sentence in sentences:
+        sentence: ParallelSentence
+        text = sentence.japanese.strip().replace("\0", "")
+        scores.append(score_sentence(text, ranks))
+        japanese += text.encode('utf8')
+        japanese.append(SENTENCE_END)
+        japanese_starts.append(len(japanese))
+        english += sentence.english.strip().encode('utf8')
+        english_starts.append(len(english))
+    return japanese, japanese_starts, english, english_starts, scores
+
+# every step of the build runs in the worker processes, and the parent only concatenates their results:
+#   1. the sentences are split into chunks, and each chunk is encoded, scored and bucketed by first character (see bucket_offsets()) in a worker
+#   2. the buckets are split into contiguous ranges of first characters, and each range is sorted in a worker
+# each range covers different first characters, so sorting the ranges independently and concatenating them gives the same suffix array as sort_suffixes(), with no merge
+def create_sentence_index_parallel(sentences: list[ParallelSentence], workers: int, ranks: dict[str, int]) -> SentenceIndex:
+    # several tasks per worker, so that a slow task doesn't leave the other workers idle
+    task_count = workers * 4
+    chunks = [sentences[len(sentences) * i // task_count:len(sentences) * (i + 1) // task_count] for i in range(task_count)]
+    print_utf8(f"encoding {len(sentences)} sentences in {workers} processes...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_worker_ranks, initargs=(ranks,)) as executor:
+        encoded_chunks = list(tqdm(executor.map(encode_chunk, chunks), total=len(chunks)))
+
+    japanese = bytearray()
+    japanese_starts = array('I', [0])
+    english = bytearray()
+    english_starts = array('I', [0])
+    scores = array('f')
+    # first character -> the bucket's offsets from each chunk, along with where that chunk starts in the full text
+    buckets: dict[bytes, list[tuple[int, bytes]]] = {}
+    bucket_sizes: dict[bytes, int] = {}
+    for chunk_japanese, chunk_japanese_starts, chunk_english, chunk_english_starts, chunk_scores, chunk_buckets in encoded_chunks:
+        japanese_base = len(japanese)
+        english_base = len(english)
+        japanese += chunk_japanese
+        english += chunk_english
+        # chunk starts are relative to the chunk, and begin with its leading 0
+        japanese_starts.extend(japanese_base + start for start in array('I', chunk_japanese_starts)[1:])
+        english_starts.extend(english_base + start for start in array('I', chunk_english_starts)[1:])
+        scores.frombytes(chunk_scores)
+        for first_character, offsets in chunk_buckets.items():
+            buckets.setdefault(first_character, []).append((japanese_base, offsets))
+            bucket_sizes[first_character] = bucket_sizes.get(first_character, 0) + len(offsets) // array('I').itemsize
+    japanese = bytes(japanese)
+
+    # split the buckets, in sorted order, into ranges of roughly equal size
+    target_size = sum(bucket_sizes.values()) / task_count
+    bucket_ranges: list[list[list[tuple[int, bytes]]]] = [[]]
+    range_size = 0
+    for first_character in sorted(buckets.keys()):
+        if range_size >= target_size:
+            bucket_ranges.append([])
+            range_size = 0
+        bucket_ranges[-1].append(buckets.pop(first_character))
+        range_size += bucket_sizes[first_character]
+
+    print_utf8(f"sorting {len(bucket_ranges)} ranges of suffixes in {workers} processes...")
+    suffixes = array('I')
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_worker_text, initargs=(japanese,)) as executor:
+        for sorted_range in tqdm(executor.map(sort_bucket_range, bucket_ranges), total=len(bucket_ranges)):
+            suffixes.frombytes(sorted_range)
+
+    return SentenceIndex(japanese, japanese_starts, bytes(english), english_starts, suffixes, scores)
 
-def uniform_type(s: str) -> bool:
-    possible_type = classify_character(s[0])
-    for c in s:
-        if classify_character(c) != possible_type:
-            return False
+# state shared by every task in a worker process, set once when the worker starts instead of being sent with each task
+worker_ranks: dict[str, int] = {}
+worker_text: bytes = b''
 
-    return True
+def set_worker_ranks(ranks: dict[str, int]) -> None:
+    global worker_ranks
+    worker_ranks = ranks
 
-# converts a Japanese sentence to n-grams
-def sentence_to_n_grams(sentence: str, n: int) -> list[str]:
-    # ensure that we don't go out-of-bounds
-    if len(sentence) < n:
-        return []
-    # get a list of n grams
-    ngrams = [sentence[i:i+n] for i in range(len(sentence)-n+1)]
-    return ngrams
+def set_worker_text(text: bytes) -> None:
+    global worker_text
+    worker_text = text
 
+# runs in a worker process; arrays are returned as raw bytes because they are much cheaper to send back than pickled arrays
+# bucket offsets are relative to the start of the chunk
+def encode_chunk(sentences: list[ParallelSentence]) -> tuple[bytes, bytes, bytes, bytes, bytes, dict[bytes, bytes]]:
+    japanese, japanese_starts, english, english_starts, scores = encode_sentences(sentences, worker_ranks)
+    japanese = bytes(japanese)
+    buckets = {first_character: array('I', offsets).tobytes() for first_character, offsets in bucket_offsets(japanese).items()}
+    return japanese, japanese_starts.tobytes(), bytes(english), english_starts.tobytes(), scores.tobytes(), buckets
+
+# runs in a worker process; sorts consecutive buckets of worker_text's suffixes
+def sort_bucket_range(bucket_range: list[list[tuple[int, bytes]]]) -> bytes:
+    suffixes = array('I')
+    for bucket_parts in bucket_range:
+        bucket = [base + offset for base, offsets in bucket_parts for offset in array('I', offsets)]
+        sort_bucket(worker_text, bucket)
+        suffixes.extend(bucket)
+    return suffixes.tobytes()
+
+# on-disk layout of a sentence index, which can be memory-mapped and queried in place:
+#   header: magic, format version, array item size, corpus size, corpus mtime (ns), corpus SHA-256, word ranks SHA-256 (see ranks_sha256()), the byte length of each section, then the SHA-256 of everything after the header
+#   sections: japanese, japanese_starts, english, english_starts, suffixes, scores (each padded to a multiple of 8 bytes)
+# the arrays are stored in native byte order, so the file is only meant to be read on the machine that built it
+INDEX_MAGIC = b'SIDX'
+INDEX_VERSION = 4
+INDEX_HEADER = struct.Struct('<4sIIQQ32s32s6Q32s')
+# the corpus size and mtime within the header, which are updated in place when the corpus is touched without being changed
+INDEX_CORPUS_STAT = struct.Struct('<QQ')
+INDEX_CORPUS_STAT_OFFSET = struct.calcsize('<4sII')
+INDEX_SECTIONS = ['japanese', 'japanese_starts', 'english', 'english_starts', 'suffixes', 'scores']
+INDEX_ARRAY_TYPES = {'japanese_starts': 'I', 'english_starts': 'I', 'suffixes': 'I', 'scores': 'f'}
+
+def file_sha256(path: Path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+# identifies the word ranks the scores were computed from, whether they came from the lemma CSV or a FrequencySource
+def ranks_sha256(ranks: dict[str, int]) -> bytes:
+    digest = hashlib.sha256()
+    for word, rank in sorted(ranks.items()):
+        digest.update(f"{word}\t{rank}\n".encode('utf8'))
+    return digest.digest()
+
+def save_sentence_index(index: SentenceIndex, index_path: Path, corpus_path: Path, ranks_hash: bytes) -> None:
+    stat = corpus_path.stat()
+    sections = [bytes(index.japanese), array('I', index.japanese_starts).tobytes(), bytes(index.english), array('I', index.english_starts).tobytes(), array('I', index.suffixes).tobytes(), array('f', index.scores).tobytes()]
+    digest = hashlib.sha256()
+    for section in sections:
+        digest.update(section)
+        digest.update(padding(len(section)))
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, array('I').itemsize, stat.st_size, stat.st_mtime_ns, file_sha256(corpus_path), ranks_hash, *[len(section) for section in sections], digest.digest())
+
+    with atomic_write(index_path) as f:
+        f.write(header)
+        f.write(padding(len(header)))
+        for section in sections:
+            f.write(section)
+            f.write(padding(len(section)))
+
+def padding(length: int) -> bytes:
+    return b'\0' * (-length % 8)
+
+# memory-maps a saved index, returning None if it doesn't exist, is damaged, or was built from a different version of the corpus or different word ranks
+# the corpus is only hashed when its size or mtime changed, so the common case costs a stat() call plus checking the index's own checksum
+def load_sentence_index(index_path: Path, corpus_path: Path, ranks_hash: bytes) -> SentenceIndex | None:
+    if not index_path.is_file():
+        return None
+    with open(index_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size < INDEX_HEADER.size:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, item_size, corpus_size, corpus_mtime, corpus_hash, file_ranks_hash, *lengths, sections_hash = INDEX_HEADER.unpack_from(mapped, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION or item_size != array('I').itemsize:
+        mapped.close()
+        return None
+    stat = corpus_path.stat()
+    if (stat.st_size, stat.st_mtime_ns) != (corpus_size, corpus_mtime):
+        if file_sha256(corpus_path) != corpus_hash:
+            print_utf8(f"sentence corpus {corpus_path} changed since {index_path} was built")
+            mapped.close()
+            return None
+        # the corpus was only touched (or copied, or checked out again), so record its new size and mtime to skip hashing it next time
+        update_index_corpus_stat(index_path, stat)
+    if ranks_hash != file_ranks_hash:
+        print_utf8(f"word ranks changed since {index_path} was built")
+        mapped.close()
+        return None
+
+    # a truncated or otherwise damaged file is rebuilt rather than failing on every run
+    sections_start = INDEX_HEADER.size + len(padding(INDEX_HEADER.size))
+    if sections_start + sum(length + len(padding(length)) for length in lengths) != file_size:
+        print_utf8(f"sentence index {index_path} has the wrong size, it will be rebuilt")
+        mapped.close()
+        return None
+    view = memoryview(mapped)
+    if hashlib.sha256(view[sections_start:]).digest() != sections_hash:
+        print_utf8(f"sentence index {index_path} failed its checksum, it will be rebuilt")
+        view.release()
+        mapped.close()
+        return None
+
+    sections = []
+    position = sections_start
+    try:
+        for name, length in zip(INDEX_SECTIONS, lengths):
+            section = view[position:position + length]
+            if name in INDEX_ARRAY_TYPES:
+                section = section.cast(INDEX_ARRAY_TYPES[name])
+            sections.append(section)
+            position += length + len(padding(length))
+    except (TypeError, ValueError):
+        print_utf8(f"sentence index {index_path} is malformed, it will be rebuilt")
+        return None
+
+    return SentenceIndex(*sections, mapped=mapped)
+
+# rewrites only the corpus size and mtime in the header of a saved index
+# failing to do so (e.g., the index is read-only) just means the corpus is hashed again next time
+def update_index_corpus_stat(index_path: Path, stat: os.stat_result) -> None:
+    try:
+        with open(index_path, 'r+b') as f:
+            f.seek(INDEX_CORPUS_STAT_OFFSET)
+            f.write(INDEX_CORPUS_STAT.pack(stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        pass
+
+# loads a "rank,frequency,lemma" CSV (such as data/japanese_lemma_frequency.csv) as lemma -> rank
+def load_lemma_ranks(path: Path = default_frequency_path) -> dict[str, int]:
+    ranks: dict[str, int] = {}
+    with open(path, 'r', encoding='utf8') as f:
+        for row in csv.DictReader(f):
+            ranks.setdefault(row['lemma'], int(row['rank']))
+    return ranks
+
+# converts a FrequencySource (see core.dictionaries.frequency) into term -> rank, for use in place of the lemma CSV
+def ranks_from_frequency_source(source: FrequencySource) -> dict[str, int]:
+    ranks: dict[str, int] = {}
+    for entry in source.entries:
+        ranks.setdefault(entry.term, entry.ranking)
+    return ranks
+
+IDEAL_SENTENCE_LENGTH = 15
+MAX_WORD_LENGTH = 8
+
+# scores how good a sentence is as an example, lower is better
+# the score combines three penalties, each roughly in [0, 1]:
+#   length: how far the sentence is from IDEAL_SENTENCE_LENGTH characters
+#   rarity: the frequency rank of the rarest known word in the sentence (on a log scale), so one obscure word makes the whole sentence worse
+#   coverage: the fraction of kanji that aren't part of any known word, which usually means rare words or names
+# words are found by greedy longest match against the frequency list, since we don't have a tokenizer
+def score_sentence(sentence: str, ranks: dict[str, int]) -> float:
+    length_penalty = min(abs(len(sentence) - IDEAL_SENTENCE_LENGTH) / IDEAL_SENTENCE_LENGTH, 1.0)
+
+    is_kanji = [t == CharType.KANJI for t in classify_string(sentence)]
+    rarest_rank = 1
+    kanji_count = 0
+    covered_kanji = 0
+    position = 0
+    while position < len(sentence):
+        word_length = 0
+        for length in range(min(MAX_WORD_LENGTH, len(sentence) - position), 0, -1):
+            if sentence[position:position + length] in ranks:
+                word_length = length
+                break
+        if word_length > 0:
+            rarest_rank = max(rarest_rank, ranks[sentence[position:position + word_length]])
+            word_kanji = sum(is_kanji[position:position + word_length])
+            kanji_count += word_kanji
+            covered_kanji += word_kanji
+            position += word_length
+        else:
+            if is_kanji[position]:
+                kanji_count += 1
+            position += 1
+
+    rarity_penalty = math.log(rarest_rank) / math.log(max(len(ranks), 2))
+    coverage_penalty = (kanji_count - covered_kanji) / kanji_count if kanji_count > 0 else 0.0
+    return length_penalty + rarity_penalty + coverage_penalty
+
+# returns the offsets of every character in text, sorted by the text following each one up to the end of its sentence
+def sort_suffixes(text: bytes, show_progress: bool = True) -> array:
+    # bucket the offsets by their first character, so that each sort only has to materialize the keys of one bucket at a time
+    buckets = bucket_offsets(text)
+    suffixes = array('I')
+    for first_character in tqdm(sorted(buckets.keys()), disable=not show_progress):
+        bucket = buckets.pop(first_character)
+        sort_bucket(text, bucket)
+        suffixes.extend(bucket)
+    return suffixes
+
+# groups the offset of every character in text by that character (as UTF-8 bytes), in increasing order of offset
+def bucket_offsets(text: bytes) -> dict[bytes, list[int]]:
+    buckets: dict[bytes, list[int]] = {}
+    for offset in range(len(text)):
+        byte = text[offset]
+        # skip sentence ends and UTF-8 continuation bytes, which aren't the start of a character
+        if byte == SENTENCE_END or 0x80 <= byte < 0xC0:
+            continue
+        first_character = text[offset:offset + utf8_length(byte)]
+        if first_character not in buckets:
+            buckets[first_character] = []
+        buckets[first_character].append(offset)
+    return buckets
+
+# sorts offsets in place by the text following each one up to the end of its sentence
+def sort_bucket(text: bytes, bucket: list[int]) -> None:
+    bucket.sort(key=lambda offset: text[offset:text.find(SENTENCE_END, offset)])
+
+# number of bytes in a UTF-8 character, given its first byte
+def utf8_length(first_byte: int) -> int:
+    if first_byte < 0x80:
+        return 1
+    elif first_byte < 0xE0:
+        return 2
+    elif first_byte < 0xF0:
+        return 3
+    else:
+        return 4
@@ -1,10 +1,11 @@
 from jamdict import Jamdict
 import sys
-from dataclasses import dataclass
-from core.vocab import load_kanji_to_vocab_mapping_uncached, load_kanji_to_vocab_mapping_cached
+from dataclasses import dataclass, field
+from core.vocab import load_kanji_to_vocab_mapping_uncached, load_kanji_to_vocab_mapping_cached, kanji_to_vocab_mapping_cache_spec, jamdict_sources, CompactVocab, KanjiVocabIndex
 from pprint import pformat
 from tqdm import tqdm
-from core.utils import cached_load, pprint_data
+from core.utils import CacheSpec, cached_load_spec, memoized, pprint_data
+from core.radicals import ComponentIndex, load_component_index, default_kradfile_paths, radical_character, variant_character
 from jamdict.jmdict import JMDEntry
 from jamdict.kanjidic2 import KanjiDic2
 
@@ -12,13 +13,15 @@ from pathlib import Path
 
 @dataclass(frozen=True)
 class Radical:
-    radical: str
+    radical: str # the radical number
     radical_type: str
+    character: str | None = None # the radical itself, if radical_type uses the Kangxi numbering
 
 @dataclass(frozen=True)
 class Variant:
-    variant: str
+    variant: str # the character set code or dictionary index of the variant
     variant_type: str
+    character: str | None = None # the variant itself, if variant_type is a character set (ucs, jis208, jis212 or jis213) rather than a dictionary index
 
 @dataclass(frozen=True)
 class Kanji:
@@ -33,81 +36,90 @@ class Kanji:
     on_yomi: list[str]
     kun_yomi: list[str]
     nanori: list[str]
-    example_words: list[JMDEntry]
-
+    example_words: list[CompactVocab] # most common first
+    components: list[str] = field(default_factory=list) # every visual component, from KRADFILE (KANJIDIC2 only records the indexing radical)
+
+# depends on the kanji -> vocab mapping cache, so anything that invalidates the mapping also invalidates this
+def kanji_cache_spec() -> CacheSpec:
+    return CacheSpec(
+        path=Path('./cache/kanji.bson'),
+        schema_version=3,
+        sources=jamdict_sources() + default_kradfile_paths,
+        code=(load_all_kanji_internal, radical_character, variant_character),
+        depends_on=(kanji_to_vocab_mapping_cache_spec(),),
+    )
+
+@memoized
 def load_all_kanji_cached() -> list[Kanji]:
-    return cached_load(load_all_kanji_cached_internal, list[Kanji], Path('./cache/kanji.bson'))
+    return cached_load_spec(load_all_kanji_cached_internal, list[Kanji], kanji_cache_spec())
 
 def load_all_kanji_cached_internal() -> list[Kanji]:
     mapping = load_kanji_to_vocab_mapping_cached()
     return load_all_kanji_internal(mapping)
 
+@memoized
 def load_all_kanji_uncached() -> list[Kanji]:
     mapping = load_kanji_to_vocab_mapping_uncached()
     return load_all_kanji_internal(mapping)
 
 
-def load_all_kanji_internal(kanji_to_vocab_mapping: dict[str, list[JMDEntry]]) -> list[Kanji]:
+def load_all_kanji_internal(kanji_to_vocab_mapping: KanjiVocabIndex, component_index: ComponentIndex | None = None) -> list[Kanji]:
+    if component_index is None:
+        component_index = load_component_index()
+
     # initialize SQLite context
     jam = Jamdict()
     sqlite_context = jam.kd2.ctx()
 
-    # fetch each kanji
+    # each table is fetched once and grouped by character id (or group id) in memory, rather than querying each table once per kanji
+    print("loading kanji tables...")
+
+    # KANJIDIC2 gives radicals and variants as numerical identifiers, so each one is resolved to its character as the table is read
+    # it also only records the single radical the kanji is indexed under (once per numbering scheme), so the full set of components comes from KRADFILE instead
+    radicals: dict[int, list[Radical]] = {}
+    for radical in sqlite_context.select("SELECT cid, value, rad_type FROM radical ORDER BY rowid"):
+        radicals.setdefault(radical['cid'], []).append(Radical(radical['value'], radical['rad_type'], radical_character(radical['value'], radical['rad_type'])))
+
+    variants: dict[int, list[Variant]] = {}
+    for variant in sqlite_context.select("SELECT cid, value, var_type FROM variant ORDER BY rowid"):
+        variants.setdefault(variant['cid'], []).append(Variant(variant['value'], variant['var_type'], variant_character(variant['value'], variant['var_type'])))
+
+    # nanori (unconventional readings)
+    nanori: dict[int, list[str]] = {}
+    for nanori_row in sqlite_context.select("SELECT cid, value FROM nanori ORDER BY rowid"):
+        nanori.setdefault(nanori_row['cid'], []).append(nanori_row['value'])
+
+    # RM groups for each kanji
+    group_ids: dict[int, list[int]] = {}
+    for group in sqlite_context.select("SELECT ID, cid FROM rm_group ORDER BY ID"):
+        group_ids.setdefault(group['cid'], []).append(group['ID'])
+
+    # use group ids to fetch meanings and readings
+    # as of 2022/12/17, there is no kanji that has more than one group
+    # the group distinction seems completely unused and is a meaningless layer of indirection
+    # as a result, we won't track meanings/readings as being part of a group, we'll just add them directly to the kanji
+    # additionally, I don't know what the 'on_type' and 'r_status' fields are, they're empty for most (maybe all) kanji, so I'll just ignore them
+    meanings: dict[int, list[str]] = {}
+    # select only English meanings (english meanings have an m_lang of the empty string)
+    for meaning in sqlite_context.select("SELECT gid, value FROM meaning WHERE m_lang = ? ORDER BY rowid", ('',)):
+        meanings.setdefault(meaning['gid'], []).append(meaning['value'])
+
+    on_yomi: dict[int, list[str]] = {}
+    kun_yomi: dict[int, list[str]] = {}
+    for reading in sqlite_context.select("SELECT gid, r_type, value FROM reading WHERE r_type IN (?, ?) ORDER BY rowid", ('ja_on', 'ja_kun')):
+        if reading['r_type'] == 'ja_on':
+            on_yomi.setdefault(reading['gid'], []).append(reading['value'])
+        if reading['r_type'] == 'ja_kun':
+            kun_yomi.setdefault(reading['gid'], []).append(reading['value'])
+
+    # build each kanji in a single pass over the characters
     all_kanji: list[Kanji] = []
     kanji_rows = sqlite_context.select("SELECT * FROM character")
     print("loading kanji...")
     for kanji_row in tqdm(kanji_rows):
         # record character id
         cid = kanji_row['ID']
-
-        # TODO: variants and radicals are given numerical identifiers, we need to grab the actual character instead
-        # fetch all radicals for this kanji
-        # BUG: this seems to only fetch one radical for each kanji
-        radical_rows = sqlite_context.select(f"SELECT * FROM radical WHERE cid='{cid}'")
-        radicals: list[Radical] = []
-        for radical in radical_rows:
-            radicals.append(Radical(radical['value'], radical['rad_type']))
-
-        # fetch all variants for this kanji
-        variant_rows = sqlite_context.select(f"SELECT * FROM variant WHERE cid='{cid}'")
-        variants: list[Variant] = []
-        for variant in variant_rows:
-            variants.append(Variant(variant['value'], variant['var_type']))
-
-        # fetch nanori (unconventional readings)
-        nanori_rows = sqlite_context.select(f"SELECT * FROM nanori WHERE cid='{cid}'")
-        nanori: list[str] = []
-        for nanori_row in nanori_rows:
-            nanori.append(nanori_row['value'])
-
-        # fetch RM groups for this kanji
-        rm_groups = sqlite_context.select(f"SELECT * FROM rm_group WHERE cid='{cid}'")
-        group_ids = [group['ID'] for group in rm_groups]
-
-        # use group ids to fetch meanings and readings
-        # as of 2022/12/17, there is no kanji that has more than one group
-        # the group distinction seems completely unused and is a meaningless layer of indirection
-        # as a result, we won't track meanings/readings as being part of a group, we'll just add them directly to the kanji
-        # additionally, I don't know what the 'on_type' and 'r_status' fields are, they're empty for most (maybe all) kanji, so I'll just ignore them
-        meanings: list[str] = []
-        on_yomi: list[str] = []
-        kun_yomi: list[str] = []
-        for group_id in group_ids:
-            # fetch meanings
-            meaning_rows = sqlite_context.select(f"SELECT * FROM meaning WHERE gid='{group_id}'")
-            for meaning in meaning_rows:
-                # select only English meanings
-                if meaning['m_lang'] == '': # english meanings have an m_lang of the empty string
-                    meanings.append(meaning['value'])
-
-            # fetch readings
-            reading_rows = sqlite_context.select(f"SELECT * FROM reading WHERE gid='{group_id}'")
-            for reading in reading_rows:
-                if reading['r_type'] == 'ja_on':
-                    on_yomi.append(reading['value'])
-                if reading['r_type'] == 'ja_kun':
-                    kun_yomi.append(reading['value'])
-
+        gids = group_ids.get(cid, [])
 
         kanji = Kanji(
             character=kanji_row['literal'],
@@ -115,13 +127,14 @@ def load_all_kanji_internal(kanji_to_vocab_mapping: dict[str, list[JMDEntry]]) -
             grade=kanji_row['grade'],
             frequency=kanji_row['freq'],
             jlpt_level=kanji_row['jlpt'],
-            radicals=radicals,
-            variants=variants,
+            radicals=radicals.get(cid, []),
+            variants=variants.get(cid, []),
             example_words=kanji_to_vocab_mapping.get(kanji_row['literal'], []),
-            meanings=meanings,
-            on_yomi=on_yomi,
-            kun_yomi=kun_yomi,
-            nanori=nanori,
+            meanings=[m for gid in gids for m in meanings.get(gid, [])],
+            on_yomi=[r for gid in gids for r in on_yomi.get(gid, [])],
+            kun_yomi=[r for gid in gids for r in kun_yomi.get(gid, [])],
+            nanori=nanori.get(cid, []),
+            components=component_index.components_of(kanji_row['literal']),
         )
         all_kanji.append(kanji)
 
@@ -2,12 +2,12 @@ from ankisync2 import Apkg
 import genanki
 import sys
 import core.anki_connect as anki_connect
+from core.deck_cache import cached_cards_and_notes_in_deck
 from core.utils import *
 from dataclasses import dataclass
 from typing import Callable
 from core.example_sentences import sentence_map, ParallelSentence
 from tqdm import tqdm
-import random
 
 @dataclass(frozen=True)
 class VocabInfo:
@@ -52,20 +52,13 @@ def card_to_api(deck_name: str, model_name: str, card: VocabCard) -> dict:
 
     }
 
-# this function builds and caches an index of n-grams to containing sentence
-@static_vars(sentence_index=None)
+# sentence_map() is memoized, so the index is only loaded once per process
 def get_example_sentences(vocab: str) -> list[ParallelSentence]:
-    if get_example_sentences.sentence_index is None:
-        get_example_sentences.sentence_index = sentence_map()
-
-    return get_example_sentences.sentence_index.get(vocab, [])
+    return sentence_map().get(vocab, [])
 
+# returns the best scoring example sentences (see core.example_sentences.score_sentence), so the output is the same on every run
 def get_example_sentences_max(vocab: str, maximum: int = 10) -> list[ParallelSentence]:
-    raw_sentences = get_example_sentences(vocab)
-    if len(raw_sentences) > maximum:
-        return random.sample(raw_sentences, maximum)
-    else:
-        return raw_sentences
+    return sentence_map().top_sentences(vocab, maximum)
 
 def count_example_sentences(vocab: set[str]):
     print_utf8("counting example sentences...")
@@ -170,12 +163,18 @@ def read_decks():
     count_example_sentences(set_18k)
 
 
-def read_deck(name: str, conversion_function: Callable[[dict], VocabInfo | None]) -> list[VocabCard]:
-    print_utf8(f"loading data from deck {name}...")
-    infos = anki_connect.get_cards_and_notes_in_deck(name)
-
+# with use_cache, the deck is read from a local snapshot and only cards/notes modified since the last run are fetched from Anki
+def read_deck(name: str, conversion_function: Callable[[dict], VocabInfo | None], use_cache: bool = True) -> list[VocabCard]:
     print_utf8(f"reading deck {name}...")
-    cards = [info_to_card(card_info, note_info, conversion_function) for card_info, note_info in tqdm(infos)]
+    if use_cache:
+        infos = cached_cards_and_notes_in_deck(name)
+        total = len(infos)
+    else:
+        card_ids = anki_connect.get_cards_in_deck(name)
+        # cards are fetched in chunks and converted as they arrive, so the raw API responses for the whole deck are never held at once
+        infos = anki_connect.iter_cards_and_notes(card_ids)
+        total = len(card_ids)
+    cards = [info_to_card(card_info, note_info, conversion_function) for card_info, note_info in tqdm(infos, total=total)]
     cards = [c for c in cards if c is not None]
 
     return cards
@@ -1,10 +1,26 @@
 from core.kanji import load_all_kanji_uncached, Kanji
 import core.anki_connect as anki
 from tqdm import tqdm
+from dataclasses import dataclass
+from typing import Callable
 
 
+new_examples_header = "----- new examples -----\n</br>\n</br>"
+old_examples_header = "\n</br>\n</br>----- old examples -----\n</br>\n</br>"
+
+# counts of what happened to each note during a field update
+@dataclass
+class FieldUpdateReport:
+    changed: int = 0 # the new value differed from the current one, and an update was sent
+    unchanged: int = 0 # the new value was identical to the current one, so no update was needed
+    skipped: int = 0 # no new value could be computed for the note (e.g., the kanji wasn't found)
+    failed: int = 0 # AnkiConnect returned an error for the update
+
+    def __str__(self) -> str:
+        return f"changed: {self.changed}, unchanged: {self.unchanged}, skipped: {self.skipped}, failed: {self.failed}"
+
 # replaces the examples field with examples taken from JMDict
-def augment_examples(deck_name: str, kanji_field: str, examples_field: str):
+def augment_examples(deck_name: str, kanji_field: str, examples_field: str, batch_size: int = anki.default_batch_size) -> FieldUpdateReport:
 
     response = anki.get_deck_names_and_ids()
     deck_id = response.get(deck_name, None)
@@ -23,34 +39,73 @@ def augment_examples(deck_name: str, kanji_field: str, examples_field: str):
     for kanji in all_kanji:
         kanji_map[kanji.character] = kanji
 
-    # update note values with additional examples
-    print("updating notes...")
-    for note in tqdm(note_infos):
+    def compute_examples(note: dict) -> str | None:
         kanji_char = note['fields'][kanji_field]['value']
         kanji_data = kanji_map.get(kanji_char, None)
-        if kanji_data is not None:
-            new_text = new_examples_text(kanji_data)
-            old_text = note['fields'][examples_field]['value']
-            updated_text = "----- new examples -----\n</br>\n</br>" + new_text + "\n</br>\n</br>----- old examples -----\n</br>\n</br>" + old_text
-            anki.update_note_field(note['noteId'], examples_field, updated_text)
+        if kanji_data is None:
+            return None
+        new_text = new_examples_text(kanji_data)
+        old_text = original_examples_text(note['fields'][examples_field]['value'])
+        return new_examples_header + new_text + old_examples_header + old_text
+
+    print("computing updated notes...")
+    updates, report = plan_field_updates(note_infos, examples_field, compute_examples)
+
+    print(f"updating {len(updates)} notes...")
+    apply_field_updates(updates, examples_field, report, batch_size)
+    print(report)
+    return report
+
+# recovers the examples that were in the field before any previous augmentation
+# this makes augmentation idempotent: re-running it produces exactly the same text instead of nesting the previous output
+def original_examples_text(text: str) -> str:
+    if text.startswith(new_examples_header) and old_examples_header in text:
+        return text.split(old_examples_header, 1)[1]
+    return text
+
+# computes the new value of field_name for every note, keeping only the notes whose value actually changes
+# returns note id -> new value, along with a report of how many notes were changed/unchanged/skipped
+def plan_field_updates(note_infos: list[dict], field_name: str, compute_value: Callable[[dict], str | None]) -> tuple[dict[int, str], FieldUpdateReport]:
+    report = FieldUpdateReport()
+    updates: dict[int, str] = {}
+    for note in tqdm(note_infos):
+        new_value = compute_value(note)
+        if new_value is None:
+            report.skipped += 1
+        elif note['fields'][field_name]['value'] == new_value:
+            report.unchanged += 1
+        else:
+            updates[note['noteId']] = new_value
+    return (updates, report)
+
+# sends the planned updates to AnkiConnect in batches, recording the outcome of each in the report
+def apply_field_updates(updates: dict[int, str], field_name: str, report: FieldUpdateReport, batch_size: int = anki.default_batch_size) -> None:
+    def record_result(result: dict) -> None:
+        if result.get('error') is None:
+            report.changed += 1
+        else:
+            report.failed += 1
+
+    with anki.batch(batch_size):
+        for note_id, new_value in tqdm(updates.items()):
+            anki.update_note_field(note_id, field_name, new_value, on_result=record_result)
 
-def new_examples_text(kanji_data: Kanji) -> str:
+# example_words are ordered by frequency, so this lists the max_examples most common words containing the kanji
+def new_examples_text(kanji_data: Kanji, max_examples: int = 10) -> str:
     str = ""
     # for each example
-    for example in kanji_data.example_words:
+    for example in kanji_data.example_words[:max_examples]:
+        kanji_forms = example.kanji_forms
+        kana_forms = example.kana_forms
         # look at each kanji form
-        for idx, form in enumerate(example.kanji_forms):
+        for idx, form in enumerate(kanji_forms):
             # if the relevant kanji is in the given form, add that writing as an example entry
-            if kanji_data.character in form.text:
+            if kanji_data.character in form:
                 # collect glossary entries (potential translations)
-                glosses: list[str] = []
-                for sense in example.senses:
-                    for gloss in sense.gloss:
-                        glosses.append(gloss.text)
-                gloss_text = ", ".join(glosses)
+                gloss_text = ", ".join(example.glosses)
                 kana_idx = idx
                 # TODO: this is probably wrong; the relationship between kana and kanji forms is unclear
-                if kana_idx >= len(example.kana_forms):
+                if kana_idx >= len(kana_forms):
                     kana_idx = 0
-                str += f"{example.kanji_forms[idx]} ({example.kana_forms[kana_idx]}): {gloss_text}\n</br>"
+                str += f"{kanji_forms[idx]} ({kana_forms[kana_idx]}): {gloss_text}\n</br>"
     return str
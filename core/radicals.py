@@ -0,0 +1,89 @@
+from __future__ import annotations
+import unicodedata
+from pathlib import Path
+from core.utils import print_utf8, memoized
+
+# KRADFILE/KRADFILE2 list the visual components of each kanji, one kanji per line ("亜 : ｜ 一 口")
+# they are distributed by the EDRDG (https://www.edrdg.org/krad/kradinf.html) and should be downloaded into ./data
+# kradfile covers JIS X 0208 and kradfile2 covers JIS X 0212, so loading both gives components for the full KANJIDIC2 character set
+default_kradfile_paths = (Path('./data/kradfile'), Path('./data/kradfile2'))
+
+# both files are EUC-JP; EUC-JIS-2004 is a superset that also decodes the JIS X 0212 characters in kradfile2
+KRADFILE_ENCODING = 'euc_jis_2004'
+
+# component <-> kanji lookups built from KRADFILE
+class ComponentIndex:
+    def __init__(self, components: dict[str, tuple[str, ...]]):
+        # kanji -> its components
+        self.components = components
+        # component -> every kanji containing it, sorted
+        self.kanji: dict[str, list[str]] = {}
+        for kanji, kanji_components in components.items():
+            for component in kanji_components:
+                self.kanji.setdefault(component, []).append(kanji)
+        for kanji_list in self.kanji.values():
+            kanji_list.sort()
+
+    def components_of(self, kanji: str) -> list[str]:
+        return list(self.components.get(kanji, ()))
+
+    # the kanji that contain every one of the given components
+    def kanji_containing(self, *components: str) -> list[str]:
+        if len(components) == 0:
+            return []
+        # start from the rarest component so the intersection stays small
+        candidates = sorted((self.kanji.get(c, []) for c in components), key=len)
+        result = set(candidates[0])
+        for kanji_list in candidates[1:]:
+            result.intersection_update(kanji_list)
+        return sorted(result)
+
+def load_kradfile(path: Path) -> dict[str, tuple[str, ...]]:
+    components: dict[str, tuple[str, ...]] = {}
+    with open(path, 'r', encoding=KRADFILE_ENCODING, errors='replace') as f:
+        for line in f:
+            # comment lines start with #
+            if line.startswith('#') or ':' not in line:
+                continue
+            kanji, component_text = line.split(':', 1)
+            components[kanji.strip()] = tuple(component_text.split())
+    return components
+
+@memoized
+def load_component_index(paths: tuple[Path, ...] = default_kradfile_paths) -> ComponentIndex:
+    components: dict[str, tuple[str, ...]] = {}
+    for path in paths:
+        if path.is_file():
+            components.update(load_kradfile(path))
+        else:
+            print_utf8(f"KRADFILE {path} not found, kanji components from it will be missing")
+    return ComponentIndex(components)
+
+# KANJIDIC2 identifies radicals by their number in the traditional 214 Kangxi radicals (both the "classical" and "nelson_c" types use this numbering)
+# the numbers map directly onto the Kangxi Radicals unicode block, and NFKC turns those compatibility characters into the ordinary kanji (e.g., radical 72 -> ⽇ -> 日)
+def radical_character(radical_number: str, radical_type: str) -> str | None:
+    if radical_type not in ('classical', 'nelson_c'):
+        return None
+    if not radical_number.isdigit() or not 1 <= int(radical_number) <= 214:
+        return None
+    return unicodedata.normalize('NFKC', chr(0x2F00 + int(radical_number) - 1))
+
+# KANJIDIC2 identifies variants by a code in some character set or dictionary
+# character set codes are converted to the character itself; dictionary indices can't be resolved without the dictionary, so they give None
+# JIS codes are "plane-row-cell" (e.g., jis208 1-48-19 is 亞); JIS X 0208 and 0212 each only have one plane, so it's ignored for them
+def variant_character(value: str, variant_type: str) -> str | None:
+    try:
+        if variant_type == 'ucs':
+            return chr(int(value, 16))
+        if variant_type not in ('jis208', 'jis212', 'jis213'):
+            return None
+        plane, row, cell = (int(p) for p in value.split('-'))
+        if variant_type == 'jis208':
+            return bytes([row + 0xA0, cell + 0xA0]).decode('euc_jp')
+        if variant_type == 'jis212':
+            return bytes([0x8F, row + 0xA0, cell + 0xA0]).decode('euc_jp')
+        # JIS X 0213 plane 2 is encoded like JIS X 0212, behind the 0x8F prefix
+        prefix = b'' if plane == 1 else b'\x8F'
+        return (prefix + bytes([row + 0xA0, cell + 0xA0])).decode(KRADFILE_ENCODING)
+    except (ValueError, UnicodeDecodeError):
+        return None
@@ -2,28 +2,51 @@ from __future__ import annotations
 import core.anki_connect as anki_connect
 from tqdm import tqdm
 from core.utils import pprint_data
+from dataclasses import dataclass
+from pathlib import Path
+import re
 import genanki
 
-def transfer_progress_anki_connect(source_deck: str, source_field: str, destination_deck: str, destination_field: str) -> None:
+progress_fields = ['reps', 'lapses', 'left', 'type', 'due', 'factor', 'queue', 'ivl']
+
+# the progress values to write to a single destination card
+@dataclass(frozen=True)
+class ProgressUpdate:
+    card_id: int
+    fields: dict[str, int]
+
+# dry_run only plans the transfer and reports how many cards would be updated
+# if a previous run was interrupted, the cards recorded in its checkpoint file are skipped
+def transfer_progress_anki_connect(source_deck: str, source_field: str, destination_deck: str, destination_field: str, dry_run: bool = False, batch_size: int = anki_connect.default_batch_size, max_retries: int = 3, checkpoint_path: Path | None = None) -> list[ProgressUpdate]:
     print(f"transferring progress from {source_deck} to {destination_deck}", flush=True)
-    print(f"fetching source deck {source_deck}", flush=True)
-    source_cards = anki_connect.get_cards_info(source_deck)
-    print(f"fetching destination deck {destination_deck}", flush=True)
-    destination_cards = anki_connect.get_cards_info(destination_deck)
+    updates = plan_progress_transfer(source_deck, source_field, destination_deck, destination_field)
+    if dry_run:
+        print(f"dry run: would update {len(updates)} cards", flush=True)
+        return updates
+
+    if checkpoint_path is None:
+        checkpoint_path = default_checkpoint_path(source_deck, destination_deck)
+    apply_progress_updates(updates, batch_size=batch_size, max_retries=max_retries, checkpoint_path=checkpoint_path)
+    return updates
 
-    print("looking through destination deck", flush=True)
-    # build a map of key -> card for destination cards
+# planning phase: matches the decks and builds the full list of updates without modifying anything
+def plan_progress_transfer(source_deck: str, source_field: str, destination_deck: str, destination_field: str) -> list[ProgressUpdate]:
+    print(f"looking through destination deck {destination_deck}", flush=True)
+    # build a map of key -> card id for destination cards
+    # cards are streamed in chunks, and only the id is kept for each one
+    destination_card_ids = anki_connect.get_cards_in_deck(destination_deck)
     destination_cards_map = {}
-    for destination_card in destination_cards:
+    for destination_card in tqdm(anki_connect.iter_card_info(destination_card_ids), total=len(destination_card_ids)):
         key = destination_card["fields"][destination_field]["value"]
-        destination_cards_map[key] = destination_card
+        destination_cards_map[key] = destination_card['cardId']
 
-    progress_fields = ['reps', 'lapses', 'left', 'type', 'due', 'factor', 'queue', 'ivl']
+    print(f"looking through source deck {source_deck}", flush=True)
+    source_card_ids = anki_connect.get_cards_in_deck(source_deck)
+    source_cards = anki_connect.iter_card_info(source_card_ids)
 
-    print("transferring progress via ankiconnect", flush=True)
-    count = 0
+    updates: list[ProgressUpdate] = []
     # look through the source deck
-    for source_card in tqdm(source_cards):
+    for source_card in tqdm(source_cards, total=len(source_card_ids)):
         # skip non-well-formed cards
         if source_field not in source_card['fields']:
             continue
@@ -33,9 +56,6 @@ def transfer_progress_anki_connect(source_deck: str, source_field: str, destinat
         key = source_card["fields"][source_field]["value"]
         # if a card in the source deck matches a card in the destination deck
         if key in destination_cards_map:
-            count += 1
-            # get destination card id
-            card_id = destination_cards_map[key]['cardId']
             # build a map of updated field values
             updated_fields = {}
             for field in progress_fields:
@@ -45,14 +65,75 @@ def transfer_progress_anki_connect(source_deck: str, source_field: str, destinat
                 else:
                     internal_field = field
                 updated_fields[field] = source_card[internal_field]
+            updates.append(ProgressUpdate(destination_cards_map[key], updated_fields))
+
+    print(f"planned updates for {len(updates)} cards", flush=True)
+    return updates
 
-            # use anki connect to update the progress fields in the destination deck
-            anki_connect.set_card_values(card_id, updated_fields)
+# execution phase: sends the updates in batched "multi" calls
+# each completed batch is appended to the checkpoint file, so an interrupted run can be restarted and will skip the cards that were already updated
+# a batch that fails is retried up to max_retries times (only the failed actions are re-sent) before giving up
+def apply_progress_updates(updates: list[ProgressUpdate], batch_size: int = anki_connect.default_batch_size, max_retries: int = 3, checkpoint_path: Path | None = None) -> None:
+    completed = load_checkpoint(checkpoint_path) if checkpoint_path is not None else set()
+    remaining = [u for u in updates if u.card_id not in completed]
+    if len(completed) > 0:
+        print(f"resuming from checkpoint {checkpoint_path}: {len(updates) - len(remaining)} cards were already updated", flush=True)
 
-    print(f"updated {count} cards", flush=True)
+    print("transferring progress via ankiconnect", flush=True)
+    batches = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
+    for batch in tqdm(batches):
+        apply_progress_batch(batch, max_retries)
+        if checkpoint_path is not None:
+            append_checkpoint(checkpoint_path, [u.card_id for u in batch])
+
+    print(f"updated {len(remaining)} cards", flush=True)
+    # the transfer is complete, so there is nothing left to resume
+    if checkpoint_path is not None and checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+def apply_progress_batch(batch: list[ProgressUpdate], max_retries: int) -> None:
+    pending = batch
+    for attempt in range(max_retries + 1):
+        try:
+            results = anki_connect.multi_action([("setSpecificValueOfCard", progress_params(u)) for u in pending], batch_size=len(pending))
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            print(f"batch request failed ({e}), retrying", flush=True)
+            continue
 
+        failed = [(u, r) for u, r in zip(pending, results) if not progress_succeeded(r)]
+        if len(failed) == 0:
+            return
+        if attempt == max_retries:
+            update, result = failed[0]
+            raise ValueError(f"operation failed for {len(failed)} cards after {max_retries} retries\nrequest: {progress_params(update)}\nresult: {result}")
+        pending = [u for u, _ in failed]
 
+def progress_params(update: ProgressUpdate) -> dict:
+    return {
+        "card": update.card_id,
+        "keys": list(update.fields.keys()),
+        "newValues": list(update.fields.values()),
+        "warning_check": True,
+    }
 
+def progress_succeeded(result: dict) -> bool:
+    return result.get('error') is None and all(result['result'])
 
+def default_checkpoint_path(source_deck: str, destination_deck: str) -> Path:
+    name = re.sub(r'[^\w\-]+', '_', f"{source_deck}_to_{destination_deck}").strip('_')
+    return Path('./cache/transfer_checkpoints') / f"{name}.txt"
 
+# the checkpoint file contains the id of each card that has been updated, one per line
+def load_checkpoint(path: Path) -> set[int]:
+    if not path.is_file():
+        return set()
+    with open(path, 'r', encoding='utf8') as f:
+        # a line without a trailing newline was cut off by an interruption while writing, so it can't be trusted
+        return set(int(line) for line in f if line.endswith("\n") and line.strip() != "")
 
+def append_checkpoint(path: Path, card_ids: list[int]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf8') as f:
+        f.write("".join(f"{card_id}\n" for card_id in card_ids))
@@ -1,28 +1,269 @@
 from dataclasses_serialization.json import JSONSerializer
 from pathlib import Path
 import sys
+import json
+import pickle
+import struct
+import hashlib
+import inspect
+from dataclasses import dataclass
 from pprint import pformat
-from typing import Any
+from typing import IO, Any, BinaryIO, Callable, Iterable, Iterator
+from contextlib import contextmanager
+import os
+import tempfile
+from collections import OrderedDict
+import functools
+from enum import IntEnum
+from abc import ABC, abstractmethod
 
-# takes basic collections (e.g., list, dict) and dataclasses as data
-def save_to_cache(data, cache_path: Path):
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    bytes = JSONSerializer.serialize(data)
-    with open(cache_path, 'wb') as f:
-        f.write(bytes)
+# converts cached data to and from bytes
+# backends are looked up by name when a cache file is read, so new ones can be added with register_cache_backend()
+class CacheBackend(ABC):
+    name: str = ""
 
-def load_from_cache(type, cache_path: Path) -> any:
+    @abstractmethod
+    def serialize(self, data: Any, type: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def deserialize(self, data: bytes, type: Any) -> Any:
+        ...
+
+# compact binary format, and by far the fastest to load for large lists of objects (e.g., list[JMDEntry])
+class PickleCacheBackend(CacheBackend):
+    name = "pickle"
+
+    def serialize(self, data: Any, type: Any) -> bytes:
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def deserialize(self, data: bytes, type: Any) -> Any:
+        return pickle.loads(data)
+
+# human-readable format, only works for basic collections and dataclasses
+class JSONCacheBackend(CacheBackend):
+    name = "json"
+
+    def serialize(self, data: Any, type: Any) -> bytes:
+        return json.dumps(JSONSerializer.serialize(data), ensure_ascii=False).encode("utf8")
+
+    def deserialize(self, data: bytes, type: Any) -> Any:
+        return JSONSerializer.deserialize(type, json.loads(data))
+
+cache_backends: dict[str, CacheBackend] = {}
+
+def register_cache_backend(backend: CacheBackend) -> None:
+    cache_backends[backend.name] = backend
+
+register_cache_backend(PickleCacheBackend())
+register_cache_backend(JSONCacheBackend())
+default_cache_backend = cache_backends["pickle"]
+
+# every cache file starts with a header: magic, format version of the header itself, the schema version of the data, the backend name, the fingerprint of the cache's inputs, and the length and SHA-256 of the payload
+# bump a cache's schema_version whenever the shape of the data it stores changes, so that old files are rebuilt instead of misread
+CACHE_MAGIC = b'ANKIEDIT'
+CACHE_FORMAT_VERSION = 3
+CACHE_HEADER = struct.Struct('<8sHI16s32sQ32s')
+NO_FINGERPRINT = bytes(32)
+
+# describes what a cache is built from, so that it can be invalidated when any of its inputs change
+#   sources: files the data is read from (identified by path, size and modification time), or plain strings such as library versions
+#   code: functions used to build the data (identified by their source code)
+#   depends_on: other caches this one is built from; their fingerprints are included in this one's, so changing an input of a dependency invalidates everything built on top of it
+@dataclass(frozen=True)
+class CacheSpec:
+    path: Path
+    schema_version: int = 0
+    sources: tuple[Path | str, ...] = ()
+    code: tuple[callable, ...] = ()
+    depends_on: tuple['CacheSpec', ...] = ()
+
+def cache_fingerprint(spec: CacheSpec) -> bytes:
+    digest = hashlib.sha256()
+    digest.update(f"schema:{spec.schema_version}\n".encode("utf8"))
+    for source in spec.sources:
+        if isinstance(source, Path):
+            # hashing the contents of large sources (e.g., the jamdict database) on every run would cost more than most cache loads, so use the file's size and mtime instead
+            if source.is_file():
+                stat = source.stat()
+                digest.update(f"file:{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf8"))
+            else:
+                digest.update(f"missing:{source}\n".encode("utf8"))
+        else:
+            digest.update(f"value:{source}\n".encode("utf8"))
+    for function in spec.code:
+        digest.update(f"code:{function.__module__}.{function.__qualname__}\n".encode("utf8"))
+        try:
+            digest.update(inspect.getsource(function).encode("utf8"))
+        except (OSError, TypeError):
+            digest.update(function.__code__.co_code)
+    for dependency in spec.depends_on:
+        digest.update(b"dependency:")
+        digest.update(cache_fingerprint(dependency))
+    return digest.digest()
+
+# raised when a cache file is missing, corrupted, was written with a different format/schema version, or was built from different inputs
+class StaleCacheError(Exception):
+    pass
+
+# takes basic collections (e.g., list, dict) and dataclasses as data (any picklable object with the default backend)
+def save_to_cache(data, cache_path: Path, type: Any = None, schema_version: int = 0, backend: CacheBackend = default_cache_backend, fingerprint: bytes = NO_FINGERPRINT):
+    payload = backend.serialize(data, type)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_FORMAT_VERSION, schema_version, backend.name.encode("utf8"), fingerprint, len(payload), hashlib.sha256(payload).digest())
+    with atomic_write(cache_path) as f:
+        f.write(header)
+        f.write(payload)
+
+# opens a temporary file next to path for writing, and renames it over path only once it has been completely written and flushed to disk
+# readers therefore see either the old file or the new one, never a partially written one, even if the writer is interrupted
+@contextmanager
+def atomic_write(path: Path) -> Iterator[BinaryIO]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # a unique name per writer, so that concurrent writers don't clobber each other's temporary files
+    descriptor, temporary_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_name, path)
+    except BaseException:
+        if os.path.exists(temporary_name):
+            os.unlink(temporary_name)
+        raise
+
+# holds an exclusive lock on a lock file for the duration of the block, blocking until other holders (in any process) release it
+# the lock is released by the OS if the holding process dies
+@contextmanager
+def file_lock(lock_path: Path) -> Iterator[None]:
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ~10 seconds, so keep retrying
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def lock_path_for(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+def load_from_cache(type, cache_path: Path, schema_version: int = 0, fingerprint: bytes = NO_FINGERPRINT) -> any:
+    if not cache_path.is_file():
+        raise StaleCacheError(f"no cache file at {cache_path}")
     with open(cache_path, 'rb') as f:
-        return JSONSerializer.deserialize(type, f.read())
+        raw = f.read()
+    if len(raw) < CACHE_HEADER.size:
+        raise StaleCacheError(f"cache file {cache_path} is too short to contain a header")
+    magic, format_version, file_schema_version, backend_name, file_fingerprint, payload_length, payload_hash = CACHE_HEADER.unpack_from(raw, 0)
+    # files written before the header existed fail this check and are rebuilt
+    if magic != CACHE_MAGIC or format_version != CACHE_FORMAT_VERSION:
+        raise StaleCacheError(f"cache file {cache_path} has an unknown format")
+    if file_schema_version != schema_version:
+        raise StaleCacheError(f"cache file {cache_path} has schema version {file_schema_version}, expected {schema_version}")
+    if file_fingerprint != fingerprint:
+        raise StaleCacheError(f"cache file {cache_path} was built from different inputs")
+    payload = raw[CACHE_HEADER.size:]
+    if len(payload) != payload_length or hashlib.sha256(payload).digest() != payload_hash:
+        raise StaleCacheError(f"cache file {cache_path} is corrupted")
+    backend = cache_backends.get(backend_name.rstrip(b'\0').decode("utf8"))
+    if backend is None:
+        raise StaleCacheError(f"cache file {cache_path} uses unknown backend {backend_name}")
+    return backend.deserialize(payload, type)
+
+def cached_load(load_function: callable, type, cache_path: Path, schema_version: int = 0, backend: CacheBackend = default_cache_backend, fingerprint: bytes = NO_FINGERPRINT) -> any:
+    try:
+        return load_from_cache(type, cache_path, schema_version, fingerprint)
+    except StaleCacheError:
+        pass
 
-def cached_load(load_function: callable, type, cache_path: Path) -> any:
-    if cache_path.exists() and cache_path.is_file():
-        return load_from_cache(type, cache_path)
-    else:
+    # only one process builds a given cache at a time, the others wait and then read what it wrote
+    with file_lock(lock_path_for(cache_path)):
+        try:
+            return load_from_cache(type, cache_path, schema_version, fingerprint)
+        except StaleCacheError as e:
+            if cache_path.exists():
+                print_utf8(f"rebuilding cache: {e}")
         data = load_function()
-        save_to_cache(data, cache_path)
+        save_to_cache(data, cache_path, type, schema_version, backend, fingerprint)
         return data
 
+# same as cached_load, but the cache is rebuilt whenever the spec's inputs (or those of its dependencies) change
+def cached_load_spec(load_function: callable, type, spec: CacheSpec, backend: CacheBackend = default_cache_backend) -> any:
+    return cached_load(load_function, type, spec.path, spec.schema_version, backend, cache_fingerprint(spec))
+
+# in-process memoization shared by the expensive loaders (dictionaries, kanji, sentence index)
+# results are kept in least-recently-used order, and the oldest are evicted once max_entries is exceeded
+# since each entry can be hundreds of MB, the bound is on the number of results rather than their size
+class MemoRegistry:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, Any] = OrderedDict()
+
+    def get(self, key: tuple) -> Any:
+        value = self.entries[key]
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: Any) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # clears the results of one function, or everything if no function is given
+    def clear(self, function: Callable | None = None) -> None:
+        if function is None:
+            self.entries.clear()
+        else:
+            name = memo_name(function)
+            for key in [k for k in self.entries if k[0] == name]:
+                del self.entries[key]
+
+memo_registry = MemoRegistry(max_entries=8)
+
+def memo_name(function: Callable) -> str:
+    return f"{function.__module__}.{function.__qualname__}"
+
+# caches the function's results in memo_registry, keyed by its arguments (which must be hashable, otherwise the call isn't memoized)
+def memoized(function: Callable) -> Callable:
+    name = memo_name(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            return memo_registry.get(key)
+        except KeyError:
+            pass
+        except TypeError: # unhashable arguments
+            return function(*args, **kwargs)
+        value = function(*args, **kwargs)
+        memo_registry.put(key, value)
+        return value
+
+    wrapper.cache_clear = lambda: memo_registry.clear(function)
+    return wrapper
+
+def clear_memoized() -> None:
+    memo_registry.clear()
+
 def pprint_data(data: Any) -> None:
     sys.stdout.buffer.write(pformat(data).encode("utf8"))
     sys.stdout.buffer.write("\n".encode("utf8"))
@@ -37,30 +278,153 @@ def static_vars(**kwargs):
         return func
     return decorate
 
-# define sets of characters to ignore
-hiragana = 'あいうえおかきくけこがぎぐげごさしすせそざじずぜぞたちつてとだぢづでどなにぬねのはひふへほばびぶべぼぱぴぷぺぽまみむめもやゆよらりるれろわを'
-katakana = 'アイウエオカキクケコガギグゲゴサシスセソザジズゼゾタチツテトダヂヅデドナニヌネノハヒフヘホバビブベボパピプペポマミムメモヤユヨラリルレロワヲ'
-small_hiragana = 'っぁぃぅぇぉょゅゃ'
-small_katakana = 'ッァィゥェォョュャ'
-punctuation = './?!:;<>[]-_+=~`ー\'\"|`'
-alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
-numbers = '1234567890'
-
-hiragana_set = set(hiragana + small_hiragana)
-katakana_set = set(katakana + small_katakana)
-non_kanji_set = set(hiragana + katakana + punctuation + small_hiragana + small_katakana + alphabet + numbers)
-
-# this is not meant to be a foolproof solution
-# this just ignores common characters in Japanese that are not kanji so that when we store a kanji -> word mapping, we don't store extra data mapping vocab words to each kana that appears
-# this can definitely be improved
+JSON_NUMBER_CHARACTERS = frozenset("0123456789.eE+-")
+
+# yields the elements of a top-level JSON array one at a time, reading the file in chunks
+# only the current chunk and the element being decoded are held in memory, rather than the whole parsed array as with json.load
+def iter_json_array(f: IO[str], chunk_size: int = 1 << 20) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    at_eof = False
+
+    # skips whitespace and returns the next character, reading more of the file if necessary
+    def next_character() -> str:
+        nonlocal buffer, position, at_eof
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if at_eof:
+                return ""
+            buffer = f.read(chunk_size)
+            position = 0
+            at_eof = buffer == ""
+
+    if next_character() != "[":
+        raise ValueError("expected a JSON array")
+    position += 1
+
+    first = True
+    while True:
+        character = next_character()
+        if character == "]":
+            return
+        if not first:
+            if character != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, found {character!r}")
+            position += 1
+            character = next_character()
+        if character == "":
+            raise ValueError("unexpected end of file inside a JSON array")
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+            else:
+                # a value is only complete once the ',' or ']' after it has been read
+                # otherwise the end of the chunk may have cut it short: "1.5" cut after "1." decodes as 1, followed by "."
+                following = end
+                while following < len(buffer) and buffer[following].isspace():
+                    following += 1
+                if following < len(buffer):
+                    if buffer[following] in ",]":
+                        break
+                    # only the tail of a number can be cut off like that, anything else really is malformed
+                    if at_eof or not all(c in JSON_NUMBER_CHARACTERS for c in buffer[end:]):
+                        raise ValueError(f"expected ',' or ']' in JSON array, found {buffer[following]!r}")
+                elif at_eof:
+                    raise ValueError("unexpected end of file inside a JSON array")
+            chunk = f.read(chunk_size)
+            at_eof = chunk == ""
+            buffer = buffer[position:] + chunk
+            position = 0
+        position = end
+        first = False
+        yield element
+
+class CharType(IntEnum):
+    OTHER = 0
+    KANJI = 1
+    HIRAGANA = 2
+    KATAKANA = 3
+
+# unicode blocks for each character type (inclusive ranges of code points)
+# anything outside these ranges (latin, digits, full-width punctuation, etc.) is CharType.OTHER
+char_type_ranges: dict[CharType, list[tuple[int, int]]] = {
+    CharType.HIRAGANA: [
+        (0x3041, 0x309F), # hiragana, including small kana, ゔ and iteration marks
+        (0x1B001, 0x1B11F), # kana supplement / extended-a (hentaigana)
+    ],
+    CharType.KATAKANA: [
+        (0x30A0, 0x30FF), # katakana, including ー and ヶ
+        (0x31F0, 0x31FF), # katakana phonetic extensions (small ㇰ etc.)
+        (0xFF66, 0xFF9F), # half-width katakana
+    ],
+    CharType.KANJI: [
+        (0x3005, 0x3007), # 々 〆 〇
+        (0x3400, 0x4DBF), # CJK extension A
+        (0x4E00, 0x9FFF), # CJK unified ideographs
+        (0xF900, 0xFAFF), # CJK compatibility ideographs
+        (0x20000, 0x323AF), # CJK extensions B through H
+        (0x2F800, 0x2FA1F), # CJK compatibility ideographs supplement
+    ],
+}
+
+# maps code points to their type as a one-character string ('\x00' to '\x03'), for use with str.translate
+# the basic multilingual plane (where almost all text lives) is precomputed, and other code points are classified on first use
+class CharTypeTable(dict):
+    def __missing__(self, code_point: int) -> str:
+        value = chr(char_type_of_code_point(code_point))
+        self[code_point] = value
+        return value
+
+def char_type_of_code_point(code_point: int) -> CharType:
+    for char_type, ranges in char_type_ranges.items():
+        for start, end in ranges:
+            if start <= code_point <= end:
+                return char_type
+    return CharType.OTHER
+
+char_type_table = CharTypeTable()
+for code_point in range(0x10000):
+    char_type_table[code_point] = chr(CharType.OTHER)
+for char_type, ranges in char_type_ranges.items():
+    for start, end in ranges:
+        for code_point in range(start, min(end, 0xFFFF) + 1):
+            char_type_table[code_point] = chr(char_type)
+
+# classifies every character of the string at once, returning one CharType value per character as bytes
+# str.translate does the table lookups in C, so this is much faster than classifying characters one by one
+def classify_string(s: str) -> bytes:
+    return s.translate(char_type_table).encode('latin1')
+
+def classify_strings(strings: Iterable[str]) -> list[bytes]:
+    return [classify_string(s) for s in strings]
+
+def classify_character(c: str) -> CharType:
+    return CharType(classify_string(c)[0])
+
+# whether all characters in the string have the same type
+def uniform_type(s: str) -> bool:
+    types = classify_string(s)
+    return types.count(types[0]) == len(types)
+
+# returns the kanji in the string, in order (including repeats)
+def extract_kanji(s: str) -> list[str]:
+    return [c for c, t in zip(s, classify_string(s)) if t == CharType.KANJI]
+
 def is_probably_kanji(character: str) -> bool:
-    return character not in non_kanji_set
+    return classify_character(character) == CharType.KANJI
 
 def is_hiragana(character: str) -> bool:
-    return character in hiragana_set
+    return classify_character(character) == CharType.HIRAGANA
 
 def is_katakana(character: str) -> bool:
-    return character in katakana_set
+    return classify_character(character) == CharType.KATAKANA
 
 def is_kana(character: str) -> bool:
-    return character in hiragana_set or character in katakana_set
\ No newline at end of file
+    return classify_character(character) in (CharType.HIRAGANA, CharType.KATAKANA)
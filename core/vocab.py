@@ -1,10 +1,13 @@
+import jamdict
 from jamdict import Jamdict
-from jamdict.jmdict import JMDEntry
+from jamdict.jmdict import JMDEntry, KanjiForm, KanaForm, Sense, SenseGloss, LSource
 from dataclasses import dataclass
 from puchikarui import ExecutionContext
 from tqdm import tqdm
-from core.utils import cached_load, pprint_data, is_probably_kanji
+from core.utils import CacheSpec, cached_load_spec, memoized, pprint_data, extract_kanji, char_type_ranges
 from pathlib import Path
+from typing import Iterable
+from array import array
 
 @dataclass(frozen=True)
 class ExampleSentence:
@@ -19,51 +22,254 @@ class VocabWord:
     english_meanings: list[str]
     example_sentences: list[str]
 
+# deduplicates strings across all vocab records, which then refer to them by integer id
+# dictionary text is extremely repetitive (e.g., the same glosses and readings appear in many entries), so each distinct string is stored once
+class StringTable:
+    __slots__ = ('strings', 'ids')
+
+    def __init__(self):
+        self.strings: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, s: str) -> int:
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(s)
+            self.ids[s] = string_id
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    # the id lookup is only needed while building, so it isn't pickled into caches
+    def __getstate__(self) -> list[str]:
+        return self.strings
+
+    def __setstate__(self, strings: list[str]) -> None:
+        self.strings = strings
+        self.ids = {s: i for i, s in enumerate(strings)}
+
+# the parts of a JMDEntry used for building kanji decks, stored as ids into a shared StringTable
+# a few of these take a fraction of the memory of the full JMDEntry object graph (which has an object per form, sense and gloss)
+@dataclass(frozen=True, slots=True, repr=False)
+class CompactVocab:
+    idseq: int
+    kanji_form_ids: tuple[int, ...]
+    kana_form_ids: tuple[int, ...]
+    gloss_ids: tuple[int, ...] # the glosses of every sense, in order
+    frequency_rank: int # approximate rank of the word by frequency (lower is more common), see jmdict_frequency_rank()
+    strings: StringTable
+
+    @property
+    def kanji_forms(self) -> list[str]:
+        return [self.strings[i] for i in self.kanji_form_ids]
+
+    @property
+    def kana_forms(self) -> list[str]:
+        return [self.strings[i] for i in self.kana_form_ids]
+
+    @property
+    def glosses(self) -> list[str]:
+        return [self.strings[i] for i in self.gloss_ids]
+
+    def __repr__(self) -> str:
+        return f"CompactVocab(idseq={self.idseq}, kanji_forms={self.kanji_forms}, kana_forms={self.kana_forms}, glosses={self.glosses})"
+
+def compact_vocab(entry: JMDEntry, strings: StringTable) -> CompactVocab:
+    return CompactVocab(
+        idseq=int(entry.idseq),
+        kanji_form_ids=tuple(strings.intern(k.text) for k in entry.kanji_forms),
+        kana_form_ids=tuple(strings.intern(k.text) for k in entry.kana_forms),
+        gloss_ids=tuple(strings.intern(gloss.text) for sense in entry.senses for gloss in sense.gloss),
+        frequency_rank=jmdict_frequency_rank([p for form in entry.kanji_forms + entry.kana_forms for p in form.pri]),
+        strings=strings,
+    )
+
+UNRANKED = 1_000_000
+
+# estimates a word's frequency rank from its JMdict priority tags (ke_pri/re_pri)
+# nfXX tags place the word in the XXth group of 500 words from a newspaper frequency list, which is the most precise signal
+# the other tags only say the word is in the top ~10-20k (news1, ichi1, spec1, gai1) or in a looser common list (news2, ichi2, spec2, gai2)
+def jmdict_frequency_rank(priority_tags: Iterable[str]) -> int:
+    rank = UNRANKED
+    for tag in priority_tags:
+        if tag.startswith('nf') and tag[2:].isdigit():
+            rank = min(rank, (int(tag[2:]) - 1) * 500 + 250)
+        elif tag in ('news1', 'ichi1', 'spec1', 'gai1'):
+            rank = min(rank, 24000)
+        elif tag in ('news2', 'ichi2', 'spec2', 'gai2'):
+            rank = min(rank, 30000)
+    return rank
+
+# inverted index from each kanji to the vocab containing it
+# vocab are numbered in order of frequency, so each kanji's postings (a sorted, de-duplicated array of those numbers) list its words from most to least common
+class KanjiVocabIndex:
+    def __init__(self, vocab: list[CompactVocab], postings: dict[str, array]):
+        self.vocab = vocab
+        self.postings = postings
+
+    def __contains__(self, kanji: str) -> bool:
+        return kanji in self.postings
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    # the k most common words containing the kanji
+    def top(self, kanji: str, k: int) -> list[CompactVocab]:
+        return [self.vocab[i] for i in self.postings.get(kanji, [])[:k]]
+
+    # mirrors dict.get, returning every word containing the kanji, most common first
+    def get(self, kanji: str, default: list[CompactVocab] | None = None) -> list[CompactVocab]:
+        if kanji not in self.postings:
+            return default
+        return [self.vocab[i] for i in self.postings[kanji]]
+
+# ranks optionally maps terms to frequency ranks (e.g., from a FrequencySource), and takes precedence over the JMdict priority tags
+# a word's rank is that of its most common written form
+def build_kanji_vocab_index(vocab_list: Iterable[CompactVocab], ranks: dict[str, int] | None = None) -> KanjiVocabIndex:
+    print("building kanji -> vocab index")
+
+    def rank(vocab: CompactVocab) -> int:
+        if ranks is not None:
+            term_ranks = [ranks[form] for form in vocab.kanji_forms + vocab.kana_forms if form in ranks]
+            if len(term_ranks) > 0:
+                return min(term_ranks)
+        return vocab.frequency_rank
+
+    vocab = sorted(vocab_list, key=lambda v: (rank(v), v.idseq))
+    postings: dict[str, array] = {}
+    for vocab_id, v in enumerate(tqdm(vocab)):
+        # a kanji can appear several times in one word (or in several of its forms), but should only be listed once
+        for char in dict.fromkeys(char for form in v.kanji_forms for char in extract_kanji(form)):
+            if char not in postings:
+                postings[char] = array('I')
+            # vocab ids are visited in increasing order, so every postings array stays sorted
+            postings[char].append(vocab_id)
+    return KanjiVocabIndex(vocab, postings)
+
+def compact_vocab_list(vocab_list: list[JMDEntry]) -> list[CompactVocab]:
+    strings = StringTable()
+    return [compact_vocab(entry, strings) for entry in vocab_list]
+
+# identifies the dictionary data that vocab/kanji caches are built from
+def jamdict_sources() -> tuple[Path | str, ...]:
+    return (Path(Jamdict().db_file), f"jamdict {getattr(jamdict, '__version__', 'unknown')}")
+
+def vocab_cache_spec() -> CacheSpec:
+    return CacheSpec(
+        path=Path('./cache/vocab.bson'),
+        sources=jamdict_sources(),
+        code=(load_all_vocab_uncached, load_all_vocab_bulk, select_grouped),
+    )
+
+def kanji_to_vocab_mapping_cache_spec() -> CacheSpec:
+    return CacheSpec(
+        path=Path('./cache/kanji_to_vocab_mapping.bson'),
+        schema_version=2,
+        # the character ranges decide which characters count as kanji
+        sources=(repr(char_type_ranges),),
+        code=(build_kanji_to_vocab_mapping, build_kanji_vocab_index, extract_kanji, compact_vocab, jmdict_frequency_rank),
+        depends_on=(vocab_cache_spec(),),
+    )
+
+# the full list of JMDEntry objects is only needed to build the compact records in the kanji -> vocab mapping, so it isn't memoized
+# (keeping it alive for the whole process would hold on to several hundred MB that the mapping no longer needs)
 def load_all_vocab_cached() -> list[JMDEntry]:
-    return cached_load(load_all_vocab_uncached, list[JMDEntry], Path('./cache/vocab.bson'))
+    return cached_load_spec(load_all_vocab_uncached, list[JMDEntry], vocab_cache_spec())
 
 def load_all_vocab_uncached() -> list[JMDEntry]:
     # initialize SQLite context
     jam = Jamdict()
     sqlite_context = jam.kd2.ctx()
     print("loading vocab...")
+    return load_all_vocab_bulk(sqlite_context)
 
+# loads every JMdict entry using one query per table over a single connection, then assembles the JMDEntry objects in memory
+# this builds the same objects as Jamdict().get_entry(idseq), except for the entry-level info (links, bibliography, etymology, audit), which nothing here uses
+def load_all_vocab_bulk(sqlite_context: ExecutionContext) -> list[JMDEntry]:
     # fetch ids for each entry
-    entry_rows = sqlite_context.select("SELECT * FROM Entry")
-    entry_ids = [row['idseq'] for row in entry_rows]
+    entries: dict[int, JMDEntry] = {}
+    for row in sqlite_context.select("SELECT idseq FROM Entry ORDER BY idseq"):
+        entries[row['idseq']] = JMDEntry(row['idseq'])
+
+    # kanji forms, and their info/priority tags
+    kanji_info = select_grouped(sqlite_context, "SELECT kid, text FROM KJI ORDER BY rowid", 'kid')
+    kanji_pri = select_grouped(sqlite_context, "SELECT kid, text FROM KJP ORDER BY rowid", 'kid')
+    for row in tqdm(sqlite_context.select("SELECT ID, idseq, text FROM Kanji ORDER BY ID"), desc="kanji forms"):
+        kanji_form = KanjiForm(row['text'])
+        kanji_form.info.extend(kanji_info.get(row['ID'], []))
+        kanji_form.pri.extend(kanji_pri.get(row['ID'], []))
+        entries[row['idseq']].kanji_forms.append(kanji_form)
+
+    # kana forms, and their info/priority/restriction tags
+    kana_info = select_grouped(sqlite_context, "SELECT kid, text FROM KNI ORDER BY rowid", 'kid')
+    kana_pri = select_grouped(sqlite_context, "SELECT kid, text FROM KNP ORDER BY rowid", 'kid')
+    kana_restr = select_grouped(sqlite_context, "SELECT kid, text FROM KNR ORDER BY rowid", 'kid')
+    for row in tqdm(sqlite_context.select("SELECT ID, idseq, text, nokanji FROM Kana ORDER BY ID"), desc="kana forms"):
+        kana_form = KanaForm(row['text'], row['nokanji'])
+        kana_form.info.extend(kana_info.get(row['ID'], []))
+        kana_form.pri.extend(kana_pri.get(row['ID'], []))
+        kana_form.restr.extend(kana_restr.get(row['ID'], []))
+        entries[row['idseq']].kana_forms.append(kana_form)
+
+    # senses, where each simple (sid, text) table maps onto a list attribute of the same name
+    sense_lists = {
+        'stagk': 'stagk',
+        'stagr': 'stagr',
+        'pos': 'pos',
+        'xref': 'xref',
+        'antonym': 'antonym',
+        'field': 'field',
+        'misc': 'misc',
+        'SenseInfo': 'info',
+        'dialect': 'dialect',
+    }
+    sense_values = {attribute: select_grouped(sqlite_context, f"SELECT sid, text FROM {table} ORDER BY rowid", 'sid') for table, attribute in sense_lists.items()}
+    sense_sources: dict[int, list[LSource]] = {}
+    for row in sqlite_context.select("SELECT sid, text, lang, lstype, wasei FROM SenseSource ORDER BY rowid"):
+        sense_sources.setdefault(row['sid'], []).append(LSource(row['lang'], row['lstype'], row['wasei'], row['text']))
+    sense_glosses: dict[int, list[SenseGloss]] = {}
+    for row in sqlite_context.select("SELECT sid, lang, gend, text FROM SenseGloss ORDER BY rowid"):
+        sense_glosses.setdefault(row['sid'], []).append(SenseGloss(row['lang'], row['gend'], row['text']))
+
+    for row in tqdm(sqlite_context.select("SELECT ID, idseq FROM Sense ORDER BY ID"), desc="senses"):
+        sense = Sense()
+        for attribute, values in sense_values.items():
+            getattr(sense, attribute).extend(values.get(row['ID'], []))
+        sense.lsource.extend(sense_sources.get(row['ID'], []))
+        sense.gloss.extend(sense_glosses.get(row['ID'], []))
+        entries[row['idseq']].senses.append(sense)
 
-    # load the JMDEntry object for each entry
-    vocab: list[JMDEntry] = []
-    for idseq in tqdm(entry_ids):
-        vocab_data = load_vocab_data(idseq)
-        vocab.append(vocab_data)
+    return list(entries.values())
 
-    # return the entire list
-    return vocab
+# runs a query returning (key, text) rows, and groups the text values by key
+def select_grouped(sqlite_context: ExecutionContext, query: str, key: str) -> dict[int, list[str]]:
+    grouped: dict[int, list[str]] = {}
+    for row in sqlite_context.select(query):
+        grouped.setdefault(row[key], []).append(row['text'])
+    return grouped
 
-def load_kanji_to_vocab_mapping_cached() -> dict[str, list[JMDEntry]]:
-    cached_load(load_kanji_to_vocab_mapping_internal_cached, dict[str, list[JMDEntry]], Path('./cache/kanji_to_vocab_mapping.bson'))
+@memoized
+def load_kanji_to_vocab_mapping_cached() -> KanjiVocabIndex:
+    return cached_load_spec(load_kanji_to_vocab_mapping_internal_cached, KanjiVocabIndex, kanji_to_vocab_mapping_cache_spec())
 
-def load_kanji_to_vocab_mapping_internal_cached() -> dict[str, list[JMDEntry]]:
+def load_kanji_to_vocab_mapping_internal_cached() -> KanjiVocabIndex:
     vocab_list = load_all_vocab_cached()
     return build_kanji_to_vocab_mapping(vocab_list)
 
-def load_kanji_to_vocab_mapping_uncached() -> dict[str, list[JMDEntry]]:
+@memoized
+def load_kanji_to_vocab_mapping_uncached() -> KanjiVocabIndex:
     vocab_list = load_all_vocab_uncached()
     return build_kanji_to_vocab_mapping(vocab_list)
 
 
-def build_kanji_to_vocab_mapping(vocab_list: list[JMDEntry]) -> dict[str, list[JMDEntry]]:
-    print("building kanji -> vocab mapping")
-    mapping: dict[str, list[JMDEntry]] = {}
-    for vocab in tqdm(vocab_list):
-        for k in vocab.kanji_forms:
-            for char in k.text:
-                if is_probably_kanji(char):
-                    if char not in mapping:
-                        mapping[char] = []
-                    mapping[char].append(vocab)
-    return mapping
+# the mapping holds compact vocab records rather than the JMDEntry objects themselves
+def build_kanji_to_vocab_mapping(vocab_list: list[JMDEntry]) -> KanjiVocabIndex:
+    return build_kanji_vocab_index(compact_vocab_list(vocab_list))
 
 def load_vocab_data(idseq: str) -> JMDEntry:
     entry: JMDEntry = Jamdict().get_entry(idseq)
@@ -65,6 +65,7 @@ def create_deck(native_dictionaries: list[BasicDictionary], english_dictionaries
     # cards by term
     cards: dict[str, VocabularyCard] = {}
 
+    # dictionary entries may be streamed from disk (e.g., Yomichan term banks), so each dictionary is consumed in a single pass and only the cards are kept in memory
     print("organizing native dictionaries", flush=True)
     for dictionary in native_dictionaries:
         # for each entry in a native dictionary
@@ -1,6 +1,6 @@
 from core.kanji import load_all_kanji_uncached, Kanji
 from jamdict.jmdict import JMDEntry
-from core.vocab import load_all_vocab_uncached
+from core.vocab import load_all_vocab_uncached, CompactVocab
 from pathlib import Path
 from core.utils import pprint_data
 from core.modify_kanji_deck import augment_examples
@@ -61,7 +61,7 @@ def augment_kanji_examples() -> None:
     augment_examples(deck_name="* JLPT N0 Recognition", kanji_field="Kanji", examples_field="Examples")
     augment_examples(deck_name="* JLPT N1 Recognition", kanji_field="Kanji", examples_field="Examples")
 
-def analyze_vocab(vocab_list: list[JMDEntry]) -> None:
+def analyze_vocab(vocab_list: list[CompactVocab]) -> None:
     total = len(vocab_list)
     for vocab in vocab_list:
         pprint_data(vocab)
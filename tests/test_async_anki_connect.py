@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.async_anki_connect import AsyncAnkiConnect, get_cards_and_notes_in_deck_async
+
+# card ids in the order findCards returns them (deliberately not sorted)
+card_ids = [9, 4, 7, 1, 8, 2, 6, 3, 5, 10]
+
+# stand-in for AnkiConnect that answers findCards/cardsInfo/notesInfo and records how many requests it was handling at once
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server: StandInServer = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.requests += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            params = request.get('params', {})
+            if request['action'] == 'findCards':
+                result = card_ids
+            elif request['action'] == 'cardsInfo':
+                # answer the chunks at the start of the deck slowest, so that responses complete out of order
+                time.sleep(0.01 * (len(card_ids) - card_ids.index(params['cards'][0])))
+                result = [{'cardId': c, 'note': c * 100} for c in params['cards']]
+            elif request['action'] == 'notesInfo':
+                time.sleep(0.01)
+                result = [{'noteId': n} for n in params['notes']]
+            else:
+                result = None
+            body = json.dumps({'result': result, 'error': None}).encode('utf8')
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class AsyncAnkiConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch_deck(self, max_in_flight: int, chunk_size: int) -> list[tuple[dict, dict]]:
+        async def fetch() -> list[tuple[dict, dict]]:
+            async with AsyncAnkiConnect(host='127.0.0.1', port=self.server.server_address[1], timeout=10, max_in_flight=max_in_flight) as client:
+                return await get_cards_and_notes_in_deck_async('Deck', chunk_size=chunk_size, client=client)
+        return asyncio.run(fetch())
+
+    def test_pairs_are_in_find_cards_order(self):
+        pairs = self.fetch_deck(max_in_flight=4, chunk_size=2)
+        self.assertEqual([card['cardId'] for card, _ in pairs], card_ids)
+        self.assertEqual([note['noteId'] for _, note in pairs], [c * 100 for c in card_ids])
+        # findCards, then cardsInfo and notesInfo for each of the 5 chunks
+        self.assertEqual(self.server.requests, 11)
+
+    def test_requests_in_flight_are_bounded(self):
+        for max_in_flight in (1, 2, 3):
+            with self.subTest(max_in_flight=max_in_flight):
+                self.server.max_in_flight = 0
+                self.fetch_deck(max_in_flight=max_in_flight, chunk_size=1)
+                self.assertLessEqual(self.server.max_in_flight, max_in_flight)
+                # the chunks are fetched concurrently, so the bound is actually reached
+                self.assertEqual(self.server.max_in_flight, max_in_flight)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from core.radicals import ComponentIndex, radical_character, variant_character
+
+class VariantCharacterTest(unittest.TestCase):
+    # (value, variant_type, character) as they appear in KANJIDIC2
+    known_variants = [
+        ('1-48-19', 'jis208', '亞'), # variant of 亜
+        ('1-16-1', 'jis208', '亜'),
+        ('1-16-1', 'jis212', '丂'),
+        ('1-16-1', 'jis213', '亜'),
+        ('4e9e', 'ucs', '亞'),
+    ]
+
+    def test_known_variants(self):
+        for value, variant_type, character in self.known_variants:
+            with self.subTest(value=value, variant_type=variant_type):
+                self.assertEqual(variant_character(value, variant_type), character)
+
+    def test_dictionary_indices_are_unresolved(self):
+        self.assertIsNone(variant_character('1234', 'nelson_c'))
+        self.assertIsNone(variant_character('2-10-3', 'deroo'))
+
+    def test_malformed_codes_are_unresolved(self):
+        self.assertIsNone(variant_character('48-19', 'jis208'))
+        self.assertIsNone(variant_character('zzzz', 'ucs'))
+
+class RadicalCharacterTest(unittest.TestCase):
+    def test_kangxi_numbers(self):
+        self.assertEqual(radical_character('1', 'classical'), '一')
+        self.assertEqual(radical_character('72', 'classical'), '日')
+        self.assertEqual(radical_character('214', 'nelson_c'), '龠')
+
+    def test_out_of_range(self):
+        self.assertIsNone(radical_character('215', 'classical'))
+        self.assertIsNone(radical_character('72', 'unknown'))
+
+class ComponentIndexTest(unittest.TestCase):
+    def test_kanji_containing(self):
+        index = ComponentIndex({'亜': ('｜', '一', '口'), '語': ('言', '五', '口')})
+        self.assertEqual(index.kanji_containing('口'), ['亜', '語'])
+        self.assertEqual(index.kanji_containing('口', '言'), ['語'])
+        self.assertEqual(index.kanji_containing('口', '木'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import io
+import json
+import random
+import unittest
+from core.utils import iter_json_array
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_numbers_cut_by_chunk_boundary(self):
+        self.assertEqual(list(iter_json_array(io.StringIO('["a", 1.5]'), chunk_size=8)), ["a", 1.5])
+        self.assertEqual(list(iter_json_array(io.StringIO('[12e5]'), chunk_size=4)), [12e5])
+        self.assertEqual(list(iter_json_array(io.StringIO('[1e+5, -0.25E-3]'), chunk_size=1)), [1e+5, -0.25e-3])
+
+    # every chunk size must give the same elements as json.loads
+    def test_chunk_sizes(self):
+        generator = random.Random(0)
+        values = ["a", "語 \"]\"", ",", 0, -17, 1.5, 12e5, -0.25e-3, 123456789, None, True, False, {"k": [1, {"c": "[,]"}]}, []]
+        for _ in range(50):
+            data = [generator.choice(values) for _ in range(generator.randint(0, 20))]
+            text = json.dumps(data, indent=generator.choice([None, 1]))
+            for chunk_size in range(1, 24):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)), data)
+
+    def test_malformed(self):
+        for text in ["", "{}", "[1,2", "[1 2]", "[1,]", "[,1]", "[1,,2]", "[1.5.5]"]:
+            for chunk_size in (1, 3, 1 << 20):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+if __name__ == '__main__':
+    unittest.main()